@@ -1,7 +1,14 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request
 from flask_cors import CORS
 from models import db
 from routes import financial_bp, donation_bp, inventory_bp, staff_bp, dashboard_bp
+from routes.cache import configure_response_cache, response_cache, ensure_table_versions
+from routes.periods import install_closed_period_guard
+from commands import register_commands, unmigrated_money_columns, obsolete_columns
+from instrumentation import install_query_instrumentation
+from metrics import install_metrics, render_metrics
+from database import sqlite_pragmas_from_env, install_sqlite_pragmas, describe_database, engine_options_from_env, pool_metrics, absolute_sqlite_url
+from sqlalchemy.exc import SQLAlchemyError
 from dotenv import load_dotenv
 import os
 from pathlib import Path
@@ -10,27 +17,68 @@ from pathlib import Path
 load_dotenv()
 
 app = Flask(__name__)
+app.logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
 
 # Ensure instance directory exists
 instance_path = Path('instance')
 instance_path.mkdir(exist_ok=True)
 
-# Configure database URI
-database_url = os.getenv('DATABASE_URL', 'sqlite:///instance/mis_database.db')
-# Convert relative path to absolute path for SQLite
-if database_url.startswith('sqlite:///'):
-    db_path = database_url.replace('sqlite:///', '')
-    if not os.path.isabs(db_path):
-        # Make it absolute path
-        db_path = os.path.abspath(db_path)
-        database_url = f'sqlite:///{db_path}'
+# Configure database URI (relative SQLite paths are made absolute)
+database_url = absolute_sqlite_url(os.getenv('DATABASE_URL', 'sqlite:///instance/mis_database.db'))
+# Optional comma-separated read replicas for GET requests
+read_urls = [absolute_sqlite_url(url.strip()) for url in os.getenv('DATABASE_READ_URL', '').split(',') if url.strip()]
 
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+app.config['SQLALCHEMY_READ_URIS'] = read_urls
+app.config['READ_YOUR_WRITES_SECONDS'] = int(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options_from_env(database_url)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+# Per-request SQL instrumentation thresholds
+app.config['SLOW_QUERY_MS'] = int(os.getenv('SLOW_QUERY_MS', 200))
+app.config['SLOW_REQUEST_MS'] = int(os.getenv('SLOW_REQUEST_MS', 1000))
+app.config['REQUEST_QUERY_LIMIT'] = int(os.getenv('REQUEST_QUERY_LIMIT', 50))
+# Per-worker metric files merged by /metrics
+app.config['METRICS_DIR'] = os.getenv('METRICS_DIR', str(instance_path / 'metrics'))
+# Seconds /metrics reuses its table row counts before counting again
+app.config['METRICS_ROW_COUNT_TTL'] = int(os.getenv('METRICS_ROW_COUNT_TTL', 60))
+# Threads per worker computing /api/dashboard/bundle widgets concurrently
+app.config['DASHBOARD_BUNDLE_WORKERS'] = int(os.getenv('DASHBOARD_BUNDLE_WORKERS', 4))
+# JSON encoder for API responses: orjson (used when installed) or stdlib
+app.config['JSON_BACKEND'] = os.getenv('JSON_BACKEND', 'orjson')
+
+if database_url.startswith('sqlite'):
+    install_sqlite_pragmas(sqlite_pragmas_from_env())
 
 CORS(app)
+install_query_instrumentation(app)
+install_metrics(app)
 db.init_app(app)
+configure_response_cache(app)
+install_closed_period_guard()
+
+with app.app_context():
+    app.logger.info(describe_database(db))
+    with db.engine.connect() as connection:
+        pending = unmigrated_money_columns(connection)
+        obsolete = obsolete_columns(connection)
+    if pending:
+        app.logger.error(
+            "Amounts are stored as decimals, not cents, in "
+            f"{', '.join(f'{table}.{column.name}' for table, column in pending)}; run `flask upgrade-db`"
+        )
+    if obsolete:
+        app.logger.error(
+            "Columns no longer used are still in the database: "
+            f"{', '.join(f'{table}.{column}' for table, column in obsolete)}; run `flask upgrade-db`"
+        )
+    try:
+        with db.engine.begin() as connection:
+            ensure_table_versions(connection)
+    except SQLAlchemyError as e:
+        app.logger.error(f"Cannot create the table_version table ({e}); responses are not cached or ETagged until it exists")
+    if read_urls:
+        app.logger.info(f"Read replicas: {len(read_urls)} (read-your-writes window {app.config['READ_YOUR_WRITES_SECONDS']}s)")
 
 # Register blueprints
 app.register_blueprint(financial_bp, url_prefix='/api/financial')
@@ -39,10 +87,27 @@ app.register_blueprint(inventory_bp, url_prefix='/api/inventory')
 app.register_blueprint(staff_bp, url_prefix='/api/staff')
 app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
 
+register_commands(app)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/api/pool-stats')
+def pool_stats():
+    """Connection pool checkout/wait counters for this worker process"""
+    return jsonify(pool_metrics.snapshot(db.engine.pool))
+
+@app.route('/api/cache-stats')
+def cache_stats():
+    """Response cache hit/miss counters for this worker process"""
+    return jsonify(response_cache.stats())
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics, merged across all worker processes"""
+    return Response(render_metrics(app), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
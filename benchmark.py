@@ -0,0 +1,404 @@
+"""
+Reproducible API benchmark
+
+Seeds a synthetic dataset shaped like init_data.py at a configurable
+scale, serves it with gunicorn and drives every GET endpoint of the five
+blueprints over HTTP, then reports throughput, latency percentiles and
+SQL queries per request (counted in-process, one request per endpoint)
+as JSON:
+
+    python benchmark.py --scale 100000 --output bench.json
+
+Compare against an earlier run and fail if any endpoint now issues more
+queries per request (e.g. a new N+1):
+
+    python benchmark.py --scale 100000 --compare bench.json
+
+Measure the list serialization paths alone (ORM objects vs. column
+projections, stdlib json vs. orjson) over every financial record:
+
+    python benchmark.py --scale 100000 --serialization
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import date, datetime, time as dtime, timedelta
+
+parser = argparse.ArgumentParser(description='Seed a synthetic dataset and benchmark the REST API')
+parser.add_argument('--scale', type=int, default=100000,
+                    help='Number of financial records; other tables are sized relative to it (default: 100000)')
+parser.add_argument('--database', default=os.path.join('instance', 'benchmark.db'),
+                    help='SQLite file to seed and benchmark (default: instance/benchmark.db)')
+parser.add_argument('--reseed', action='store_true', help='Drop and re-seed the database even if it holds data')
+parser.add_argument('--as-of', type=date.fromisoformat,
+                    help='Last day of the seeded dates, which cover the three years before it; a scale '
+                         'and date always seed the same rows (default: today in UTC, where the ?days= '
+                         'dashboard windows end)')
+parser.add_argument('--requests', type=int, default=20, help='Requests per endpoint (default: 20)')
+parser.add_argument('--endpoint', action='append', help='Only benchmark endpoints containing this text')
+parser.add_argument('--with-cache', action='store_true', help='Keep the dashboard response cache enabled')
+parser.add_argument('--output', help='Also write the JSON report to this file')
+parser.add_argument('--compare', help='Earlier JSON report; exit 1 if queries per request grew')
+parser.add_argument('--serialization', action='store_true',
+                    help='Only compare list serialization paths on all financial records')
+parser.add_argument('--in-process', action='store_true',
+                    help='Time requests through the Flask test client instead of gunicorn over HTTP')
+parser.add_argument('--port', type=int, default=6690, help='Port of the benchmarked gunicorn (default: 6690)')
+parser.add_argument('--workers', type=int, default=1, help='gunicorn worker processes (default: 1)')
+args = parser.parse_args()
+args.as_of = args.as_of or datetime.utcnow().date()
+
+# The app reads its configuration at import time
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.database)
+if not args.with_cache:
+    os.environ['RESPONSE_CACHE'] = 'none'
+
+from flask import json as flask_json
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app, db
+from models import (
+    Staff, Donor, Donation, DonationFinancialRecord, Gift, FinancialRecord, Inventory, Supplier,
+    PurchaseOrder, PurchaseOrderInventory, Expense, Attendance, Schedule, PerformanceReview,
+    DemandPlan, PayrollRecord
+)
+from routes.rollups import rebuild_rollups
+from routes.serializers import FINANCIAL_RECORD
+from routes.utils import dumps, orjson
+from loadtest import summarize, gunicorn_server
+
+SEED_CHUNK_SIZE = 10000
+
+# GET endpoints of the five blueprints. List endpoints that support keyset
+# pagination are requested one page at a time, as the UI would at scale.
+ENDPOINTS = [
+    '/api/financial/records?limit=50',
+    '/api/financial/records?type=Income&limit=50',
+    '/api/financial/records/1',
+    '/api/financial/summary',
+    '/api/financial/balances?account_code=ACC5000&as_of=2024-06-30',
+    '/api/financial/expenses',
+    '/api/donation/donations?limit=50',
+    '/api/donation/donations/1',
+    '/api/donation/donors?limit=50',
+    '/api/donation/donors/1',
+    '/api/donation/demographics',
+    '/api/donation/gifts',
+    '/api/inventory/items',
+    '/api/inventory/items/1',
+    '/api/inventory/demand-plans',
+    '/api/inventory/suppliers',
+    '/api/inventory/suppliers/1',
+    '/api/inventory/purchase-orders?limit=50',
+    '/api/staff/staff',
+    '/api/staff/staff/1',
+    '/api/staff/attendance?limit=50',
+    '/api/staff/schedules?limit=50',
+    '/api/staff/performance-reviews',
+    '/api/staff/payroll?limit=50',
+    '/api/dashboard/overview',
+    '/api/dashboard/financial-trends?days=30',
+    '/api/dashboard/donation-trends?days=30',
+    '/api/dashboard/top-donors?limit=10',
+    '/api/dashboard/expense-breakdown',
+    '/api/dashboard/bundle',
+    '/api/dashboard/aggregate?source=ledger&group_by=type,month',
+    '/api/dashboard/aggregate?source=donations&group_by=region,quarter&metrics=sum,count,avg',
+]
+
+def table_sizes(scale):
+    """Row counts per model, relative to the number of financial records"""
+    return {
+        DemandPlan: max(10, scale // 1000),
+        Inventory: max(10, scale // 1000),
+        Supplier: max(5, scale // 10000),
+        Staff: max(10, scale // 1000),
+        Donor: max(10, scale // 50),
+        Gift: max(10, scale // 100),
+        FinancialRecord: scale,
+        Donation: scale // 2,
+        PurchaseOrder: scale // 20,
+        Expense: scale // 100,
+        Attendance: scale // 4,
+        Schedule: scale // 4,
+        PayrollRecord: scale // 20,
+        PerformanceReview: max(10, scale // 1000),
+    }
+
+def random_day(days_back=1095):
+    return args.as_of - timedelta(days=random.randint(0, days_back))
+
+def money(low, high):
+    return round(random.uniform(low, high), 2)
+
+def synthetic_row(model, i, sizes):
+    """One row for `model`; `i` is 1-based, so it doubles as the primary key"""
+    if model is DemandPlan:
+        return {'ItemName': f'Item {i}', 'ForecastQuantity': random.randint(10, 500), 'PlanDate': random_day()}
+    if model is Inventory:
+        return {'ItemName': f'Item {i}', 'Quantity': random.randint(0, 1000),
+                'Location': random.choice(['Warehouse A', 'Warehouse B', 'Warehouse C', 'Storage Room']),
+                'DemandPlanID': random.randint(1, sizes[DemandPlan])}
+    if model is Supplier:
+        return {'Name': f'Supplier {i}', 'ContactInfo': f'supplier{i}@example.com', 'Address': f'{i} Supply Street'}
+    if model is Staff:
+        return {'Name': f'Staff {i}', 'Role': random.choice(['Manager', 'Nurse', 'Caregiver', 'Administrator']),
+                'ContactInfo': f'staff{i}@eldercare.org', 'Status': random.choice(['Active'] * 9 + ['Inactive'])}
+    if model is Donor:
+        return {'Name': f'Donor {i}', 'ContactInfo': f'donor{i}@email.com', 'RegistrationDate': random_day(),
+                'Age': random.randint(25, 95), 'Region': random.choice(['North', 'South', 'East', 'West'])}
+    if model is Gift:
+        return {'GiftType': random.choice(['Food', 'Clothing', 'Medical Supplies', 'Equipment']),
+                'Quantity': random.randint(1, 100), 'DistributionDate': random_day()}
+    if model is FinancialRecord:
+        return {'TransactionDate': random_day(), 'TransactionType': random.choice(['Income', 'Expense', 'Donation']),
+                'AccountCode': f'ACC{random.randint(1000, 9999)}', 'Amount': money(10, 5000),
+                'Description': f'Synthetic transaction {i}'}
+    if model is Donation:
+        monetary = random.random() < 0.8
+        return {'DonationType': 'Monetary' if monetary else 'Gift',
+                'Status': random.choice(['Completed', 'Pending']),
+                'Amount': money(10, 5000) if monetary else 0, 'DonationDate': random_day(),
+                'DonorID': random.randint(1, sizes[Donor]), 'StaffID': random.randint(1, sizes[Staff]),
+                'GiftID': None if monetary else random.randint(1, sizes[Gift])}
+    if model is PurchaseOrder:
+        return {'OrderDate': random_day(), 'TotalAmount': money(100, 10000),
+                'Status': random.choice(['Pending', 'Approved', 'Delivered']),
+                'SupplierID': random.randint(1, sizes[Supplier]), 'DemandPlanID': random.randint(1, sizes[DemandPlan])}
+    if model is Expense:
+        return {'Date': random_day(), 'Type': random.choice(['Utilities', 'Rent', 'Maintenance', 'Transportation', 'Other']),
+                'Amount': money(50, 3000), 'Description': f'Synthetic expense {i}',
+                'StaffID': random.randint(1, sizes[Staff])}
+    if model is Attendance:
+        return {'Date': random_day(), 'CheckIn': dtime(random.randint(7, 9), random.choice([0, 15, 30])),
+                'CheckOut': dtime(random.randint(16, 18), random.choice([0, 15, 30])),
+                'Status': random.choice(['Present'] * 8 + ['Late', 'Absent']), 'StaffID': random.randint(1, sizes[Staff])}
+    if model is Schedule:
+        return {'ShiftDate': random_day(), 'ShiftType': random.choice(['Morning', 'Afternoon', 'Night']),
+                'Field': random.choice(['Nursing', 'Care', 'Administration']), 'Hours': 8,
+                'Location': random.choice(['Building A', 'Building B']), 'StaffID': random.randint(1, sizes[Staff])}
+    if model is PayrollRecord:
+        day = random_day()
+        return {'PayPeriod': day.strftime('%Y-%m'), 'Amount': money(2000, 6000), 'PaymentDate': day,
+                'StaffID': random.randint(1, sizes[Staff])}
+    if model is PerformanceReview:
+        return {'ReviewDate': random_day(), 'Score': money(1, 5), 'Comments': f'Synthetic review {i}',
+                'StaffID': random.randint(1, sizes[Staff])}
+    raise ValueError(f'No synthetic rows for {model.__name__}')
+
+def insert_chunked(table, rows):
+    """executemany `rows` (an iterable of dicts) in SEED_CHUNK_SIZE batches"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= SEED_CHUNK_SIZE:
+            db.session.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+    db.session.commit()
+
+def seed(scale):
+    """Recreate the schema and fill it with synthetic rows"""
+    random.seed(scale)
+    db.drop_all()
+    db.create_all()
+    sizes = table_sizes(scale)
+    for model, count in sizes.items():
+        start = time.perf_counter()
+        insert_chunked(model.__table__, (synthetic_row(model, i, sizes) for i in range(1, count + 1)))
+        print(f'Seeded {count} {model.__tablename__} rows in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+
+    # Line items and ledger links, so the relationship-heavy views have work to do
+    insert_chunked(PurchaseOrderInventory.__table__, (
+        {'PurchaseOrderID': po_id, 'InventoryID': inventory_id, 'Quantity': random.randint(1, 50)}
+        for po_id in range(1, sizes[PurchaseOrder] + 1)
+        for inventory_id in random.sample(range(1, sizes[Inventory] + 1), 2)
+    ))
+    insert_chunked(DonationFinancialRecord.__table__, (
+        {'DonationID': donation_id, 'FinancialRecordID': donation_id}
+        for donation_id in range(1, sizes[Donation] + 1)
+    ))
+    rebuild_rollups()
+
+def capture_queries():
+    """Count SQL statements issued on any engine; returns the counter list"""
+    counter = [0]
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counter[0] += 1
+
+    event.listen(Engine, 'before_cursor_execute', count)
+    return counter, lambda: event.remove(Engine, 'before_cursor_execute', count)
+
+def count_queries(client, urls):
+    """SQL statements of one in-process request to each of `urls`, streamed
+    bodies included (a served response's Server-Timing header stops at the
+    headers)"""
+    counter, stop = capture_queries()
+    queries = {}
+    try:
+        for url in urls:
+            client.get(url).get_data()  # warm up
+            before = counter[0]
+            client.get(url).get_data()
+            queries[url] = counter[0] - before
+    finally:
+        stop()
+    return queries
+
+def test_client_get(client):
+    def get(url):
+        response = client.get(url)
+        return response.status_code, response.get_data()  # drains streamed bodies inside the timing
+    return get
+
+def http_get(base_url):
+    def get(url):
+        try:
+            with urllib.request.urlopen(base_url + url, timeout=120) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+    return get
+
+def bench_endpoint(get, url, requests):
+    """Time `requests` sequential GETs of `url`; `get(url)` returns (status, body)"""
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        t = time.perf_counter()
+        status, body = get(url)
+        latencies.append(time.perf_counter() - t)
+        if status >= 400:
+            errors += 1
+    result = summarize(latencies, errors, time.perf_counter() - start)
+    result['response_bytes'] = len(body)
+    return result
+
+def bench_endpoints(get, urls, requests, queries):
+    for url in urls:
+        get(url)  # warm up
+    results = {}
+    for url in urls:
+        results[url] = bench_endpoint(get, url, requests)
+        results[url]['queries_per_request'] = queries[url]
+        print(f"{url}: {results[url]['p50_ms']}ms p50, {queries[url]} queries", file=sys.stderr)
+    return results
+
+def orm_financial_records():
+    """The list path before projections: full ORM objects, dicts built per attribute"""
+    return [{
+        'id': r.FinancialRecordID,
+        'date': r.TransactionDate.isoformat() if r.TransactionDate else None,
+        'type': r.TransactionType,
+        'amount': float(r.Amount) if r.Amount else 0,
+        'account_code': r.AccountCode,
+        'description': r.Description
+    } for r in FinancialRecord.query.all()]
+
+def projected_financial_records():
+    return FINANCIAL_RECORD.serialize_all(FINANCIAL_RECORD.query().all())
+
+# (name, load rows into dicts, encode them)
+SERIALIZATION_PATHS = [
+    ('orm+stdlib', orm_financial_records, flask_json.dumps),
+    ('projection+stdlib', projected_financial_records, flask_json.dumps),
+    ('projection+orjson', projected_financial_records, dumps),
+]
+
+def bench_serialization(rounds=3):
+    """Best-of-`rounds` rows/sec of each SERIALIZATION_PATHS entry"""
+    results = {}
+    for name, load, encode in SERIALIZATION_PATHS:
+        best = None
+        for _ in range(rounds):
+            db.session.remove()
+            gc.collect()
+            t = time.perf_counter()
+            rows = load()
+            loaded = time.perf_counter()
+            body = encode(rows)
+            done = time.perf_counter()
+            if best is None or done - t < best['total_ms'] / 1000:
+                best = {
+                    'rows': len(rows),
+                    'load_ms': round((loaded - t) * 1000, 1),
+                    'encode_ms': round((done - loaded) * 1000, 1),
+                    'total_ms': round((done - t) * 1000, 1),
+                    'rows_per_second': round(len(rows) / (done - t)),
+                    'response_bytes': len(body)
+                }
+        results[name] = best
+        print(f"{name}: {best['rows_per_second']} rows/s", file=sys.stderr)
+    return results
+
+def compare(report, baseline_path):
+    """Endpoints whose queries per request grew since the baseline report"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['endpoints']
+    return {
+        url: {'before': baseline[url]['queries_per_request'], 'after': result['queries_per_request']}
+        for url, result in report['endpoints'].items()
+        if url in baseline and result['queries_per_request'] > baseline[url]['queries_per_request']
+    }
+
+def main():
+    with app.app_context():
+        db.create_all()
+        existing = FinancialRecord.query.count()
+        # The seeding date is kept in SQLite's user_version (0: unknown)
+        seeded_as_of = db.session.execute(db.text('PRAGMA user_version')).scalar()
+        if args.reseed or not existing:
+            seed(args.scale)
+            db.session.execute(db.text(f'PRAGMA user_version = {args.as_of.toordinal()}'))
+            db.session.commit()
+        elif existing != args.scale:
+            sys.exit(f'{args.database} holds {existing} financial records, not {args.scale}; '
+                     'pass --reseed to drop and re-seed it')
+        elif seeded_as_of != args.as_of.toordinal():
+            seeded = date.fromordinal(seeded_as_of).isoformat() if seeded_as_of else 'an unknown date'
+            sys.exit(f'{args.database} was seeded up to {seeded}, not {args.as_of}; '
+                     'pass --as-of or --reseed to drop and re-seed it')
+        row_counts = {model.__tablename__: model.query.count() for model in table_sizes(args.scale)}
+
+    if args.serialization:
+        if orjson is None or app.config['JSON_BACKEND'] == 'stdlib':
+            print('orjson is not in use; projection+orjson falls back to Flask\'s encoder', file=sys.stderr)
+        with app.app_context():
+            print(json.dumps({'scale': args.scale, 'serialization': bench_serialization()}, indent=2))
+        return
+
+    endpoints = [url for url in ENDPOINTS if not args.endpoint or any(text in url for text in args.endpoint)]
+    client = app.test_client()
+    queries = count_queries(client, endpoints)
+    if args.in_process:
+        results = bench_endpoints(test_client_get(client), endpoints, args.requests, queries)
+    else:
+        with tempfile.TemporaryDirectory() as workdir, \
+                gunicorn_server(os.environ['DATABASE_URL'], args.port, workdir, workers=args.workers) as base_url:
+            results = bench_endpoints(http_get(base_url), endpoints, args.requests, queries)
+
+    report = {'scale': args.scale, 'as_of': args.as_of.isoformat(), 'server': 'test client' if args.in_process else 'gunicorn',
+              'rows': row_counts, 'requests_per_endpoint': args.requests, 'endpoints': results}
+    if args.compare:
+        report['query_regressions'] = compare(report, args.compare)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    if report.get('query_regressions'):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
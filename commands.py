@@ -0,0 +1,343 @@
+"""
+Maintenance commands, available through the Flask CLI (e.g. `flask rebuild-rollups`)
+"""
+import re
+import click
+from datetime import date, timedelta
+from decimal import Decimal
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, inspect, func, case, Integer
+from sqlalchemy.engine import Engine
+from models import db, Money, Donor, FinancialRecord, AccountDailyBalance, AccountPeriodChange, AccountBalance
+from routes.rollups import rebuild_rollups, track_financial_record
+from routes.aggregates import account_balances, INCOME_TYPES, UNASSIGNED_ACCOUNT
+from routes.imports import IMPORT_CHUNK_SIZE
+from routes.donation import insert_donations
+from routes.financial import insert_financial_records
+
+# GET requests whose queries must be served from an index. Whole-table
+# reports (overview, summary, demographics, unfiltered lists) are
+# deliberately absent: they scan by design.
+QUERY_PLAN_CASES = [
+    '/api/financial/records?type=Income',
+    '/api/financial/records?start_date=2024-01-01&end_date=2024-12-31',
+    '/api/financial/records?limit=50',
+    '/api/donation/donations?status=Completed',
+    '/api/donation/donations?donor_id=1',
+    '/api/donation/donations?limit=50',
+    '/api/donation/donors?region=North',
+    '/api/donation/donors?limit=50',
+    '/api/inventory/purchase-orders?status=Pending',
+    '/api/inventory/purchase-orders?limit=50',
+    '/api/staff/attendance?staff_id=1',
+    '/api/staff/attendance?start_date=2024-01-01&end_date=2024-12-31',
+    '/api/staff/attendance?limit=50',
+    '/api/staff/schedules?staff_id=1',
+    '/api/staff/schedules?limit=50',
+    '/api/staff/payroll?staff_id=1',
+    '/api/staff/payroll?limit=50',
+    '/api/dashboard/financial-trends?days=30',
+    '/api/dashboard/donation-trends?days=30',
+    '/api/financial/balances?account_code=ACC1000&as_of=2024-06-30',
+]
+
+# (few rows, many rows) URL pairs that must issue the same number of
+# queries: eager loading keeps the count independent of the row count
+QUERY_COUNT_CASES = [
+    ('/api/inventory/purchase-orders?limit=1', '/api/inventory/purchase-orders?limit=200'),
+    ('/api/inventory/purchase-orders?limit=1&include=items', '/api/inventory/purchase-orders?limit=200&include=items'),
+    ('/api/inventory/purchase-orders?limit=1&include=supplier', '/api/inventory/purchase-orders?limit=200&include=supplier'),
+    ('/api/inventory/purchase-orders?limit=1&include=', '/api/inventory/purchase-orders?limit=200&include='),
+    ('/api/financial/records?limit=1', '/api/financial/records?limit=200'),
+    ('/api/donation/donations?limit=1', '/api/donation/donations?limit=200'),
+    ('/api/donation/donors?limit=1', '/api/donation/donors?limit=200'),
+    ('/api/staff/attendance?limit=1', '/api/staff/attendance?limit=200'),
+    ('/api/staff/schedules?limit=1', '/api/staff/schedules?limit=200'),
+    ('/api/staff/payroll?limit=1', '/api/staff/payroll?limit=200'),
+    ('/api/inventory/purchase-orders?limit=1&fields=id,status', '/api/inventory/purchase-orders?limit=200&fields=id,status'),
+]
+
+# Bulk import chunk inserters and a validated row for each (given a donor
+# and a date). A full chunk must issue as many statements as a single row:
+# one executemany per table, never one INSERT per row. All rows share one
+# date, donor and account, so rollup and balance updates stay constant too.
+IMPORT_STATEMENT_CASES = [
+    ('donations', insert_donations, lambda donor_id, day: {
+        'DonationType': 'Monetary', 'Status': 'Completed', 'Amount': Decimal('10.00'),
+        'DonationDate': day, 'DonorID': donor_id, 'StaffID': None, 'GiftID': None
+    }),
+    ('financial records', insert_financial_records, lambda donor_id, day: {
+        'TransactionDate': day, 'TransactionType': 'Income', 'AccountCode': None,
+        'Amount': Decimal('10.00'), 'Description': None
+    }),
+]
+
+# Columns removed from the models that upgrade-db drops from existing
+# databases (a leftover NOT NULL column would make inserts fail)
+OBSOLETE_COLUMNS = [
+    ('account_daily_balance', 'Balance'),  # balances are kept per account in account_balance
+]
+
+# "SCAN donation" (or "SCAN TABLE donation" on older SQLite) without a
+# following "USING ... INDEX" is a full table scan. Scans of anon_N are
+# reads of an already computed subquery, not of a table.
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(?!anon_\d+$)(\w+)$')
+
+def money_columns():
+    """(table, column) of every Money column in the models"""
+    return [
+        (table.name, column)
+        for table in db.metadata.sorted_tables
+        for column in table.columns
+        if isinstance(column.type, Money)
+    ]
+
+def unmigrated_money_columns(connection):
+    """Money columns whose database column still holds decimal amounts
+    (any non-integer type) rather than integer cents"""
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    pending = []
+    for table, column in money_columns():
+        if table not in existing:
+            continue
+        types = {c['name']: c['type'] for c in inspector.get_columns(table)}
+        if column.name in types and not isinstance(types[column.name], Integer):
+            pending.append((table, column))
+    return pending
+
+def obsolete_columns(connection):
+    """(table, column name) of every OBSOLETE_COLUMNS entry still in the database"""
+    inspector = inspect(connection)
+    existing = set(inspector.get_table_names())
+    return [
+        (table, column) for table, column in OBSOLETE_COLUMNS
+        if table in existing and column in {c['name'] for c in inspector.get_columns(table)}
+    ]
+
+def migrate_money_column(connection, table, column):
+    """Convert a decimal amount column to integer cents in place.
+
+    The cents go into a new BIGINT column that then replaces the old one
+    (SQLite cannot change a column's type), so the converted column is
+    recognised as migrated and the conversion never runs twice. Needs
+    SQLite 3.35+ for DROP COLUMN.
+    """
+    quote = connection.dialect.identifier_preparer.quote
+    cents = column.name + '_cents'
+    if cents in {c['name'] for c in inspect(connection).get_columns(table)}:
+        # Left over from an interrupted run
+        connection.exec_driver_sql(f'ALTER TABLE {quote(table)} DROP COLUMN {quote(cents)}')
+    not_null = '' if column.nullable else ' NOT NULL DEFAULT 0'
+    integer = 'SIGNED' if connection.dialect.name == 'mysql' else 'BIGINT'
+    connection.exec_driver_sql(f'ALTER TABLE {quote(table)} ADD COLUMN {quote(cents)} BIGINT{not_null}')
+    connection.exec_driver_sql(
+        f'UPDATE {quote(table)} SET {quote(cents)} = CAST(ROUND({quote(column.name)} * 100) AS {integer})'
+    )
+    connection.exec_driver_sql(f'ALTER TABLE {quote(table)} DROP COLUMN {quote(column.name)}')
+    connection.exec_driver_sql(f'ALTER TABLE {quote(table)} RENAME COLUMN {quote(cents)} TO {quote(column.name)}')
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """Recompute the daily financial and donation rollup tables and the
+    account balances"""
+    db.create_all()
+    financial_rows, donation_rows, balance_rows = rebuild_rollups()
+    click.echo(f"Rebuilt {financial_rows} financial and {donation_rows} donation rollup rows, "
+               f"and {balance_rows} account balance rows")
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Create any missing tables and indexes on an existing database,
+    convert decimal amounts to integer cents and drop obsolete columns"""
+    db.create_all()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+            click.echo(f"Index {index.name} on {table.name}: ok")
+    
+    with db.engine.begin() as connection:
+        for table, column in unmigrated_money_columns(connection):
+            migrate_money_column(connection, table, column)
+            click.echo(f"Money column {table}.{column.name}: converted to cents")
+        quote = connection.dialect.identifier_preparer.quote
+        for table, column in obsolete_columns(connection):
+            connection.exec_driver_sql(f'ALTER TABLE {quote(table)} DROP COLUMN {quote(column)}')
+            click.echo(f"Obsolete column {table}.{column}: dropped")
+
+def _capture_statements(client, url):
+    statements = []
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+    
+    # Listen on every engine so queries routed to a read replica are seen too
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+        response.get_data()  # streamed bodies query while they are read
+    finally:
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
+    
+    if response.status_code != 200:
+        raise click.ClickException(f"{url} returned HTTP {response.status_code}")
+    return statements
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans_command():
+    """Fail if any indexed route query falls back to a full table scan"""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException("check-query-plans only supports SQLite databases")
+    
+    client = current_app.test_client()
+    failures = []
+    
+    for url in QUERY_PLAN_CASES:
+        url_failures = []
+        for statement, parameters in dict(_capture_statements(client, url)).items():
+            plan = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+            scans = [row[3] for row in plan if FULL_SCAN.match(row[3])]
+            if scans:
+                url_failures.append((url, statement, scans))
+        click.echo(f"{'FAIL' if url_failures else 'ok  '} {url}")
+        failures.extend(url_failures)
+    
+    for url, statement, scans in failures:
+        click.echo(f"\n{url}: {', '.join(scans)}\n{statement}", err=True)
+    if failures:
+        raise click.ClickException(f"{len(failures)} route queries do full table scans")
+
+@click.command('check-query-counts')
+@with_appcontext
+def check_query_counts_command():
+    """Fail if a list route issues more queries for more rows (N+1 loading)"""
+    client = current_app.test_client()
+    failures = []
+    
+    for small_url, large_url in QUERY_COUNT_CASES:
+        small = len(_capture_statements(client, small_url))
+        large = len(_capture_statements(client, large_url))
+        failed = large != small
+        click.echo(f"{'FAIL' if failed else 'ok  '} {large_url}: {large} queries ({small} for {small_url})")
+        if failed:
+            failures.append(large_url)
+    
+    if failures:
+        raise click.ClickException(f"{len(failures)} routes issue a query count that grows with their rows")
+
+def _chunk_statements(insert, chunk):
+    """Statements sent while inserting `chunk`, which is then rolled back"""
+    statements = []
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        insert(chunk)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
+        db.session.rollback()
+    return statements
+
+@click.command('check-import-statements')
+@with_appcontext
+def check_import_statements_command():
+    """Fail if a bulk import chunk issues more statements for more rows.
+    Nothing is written: every chunk is rolled back."""
+    donor_id = db.session.query(Donor.DonorID).order_by(Donor.DonorID).limit(1).scalar()
+    if donor_id is None:
+        raise click.ClickException("check-import-statements needs at least one donor")
+    failures = []
+    
+    for label, insert, row in IMPORT_STATEMENT_CASES:
+        small = len(_chunk_statements(insert, [(1, row(donor_id, date.today()))]))
+        large = len(_chunk_statements(insert, [
+            (number, row(donor_id, date.today())) for number in range(1, IMPORT_CHUNK_SIZE + 1)
+        ]))
+        failed = large != small
+        click.echo(f"{'FAIL' if failed else 'ok  '} {label}: {large} statements for {IMPORT_CHUNK_SIZE} rows ({small} for 1)")
+        if failed:
+            failures.append(label)
+    
+    if failures:
+        raise click.ClickException(f"{len(failures)} bulk imports issue a statement per row")
+
+@click.command('check-balances')
+@with_appcontext
+def check_balances_command():
+    """Fail if account balances, current or as of the middle of the ledger,
+    disagree with it, or if a backdated entry writes more than its own
+    day, month, year and balance rows. The backdated entry is rolled back."""
+    ledger = FinancialRecord
+    account = func.coalesce(ledger.AccountCode, UNASSIGNED_ACCOUNT)
+    first, last = db.session.query(func.min(ledger.TransactionDate), func.max(ledger.TransactionDate)).one()
+    if first is None:
+        raise click.ClickException("check-balances needs at least one ledger entry")
+    
+    wrong = []
+    for as_of in (None, first + (last - first) / 2):
+        expected = db.session.query(
+            account, func.sum(case((ledger.TransactionType.in_(INCOME_TYPES), ledger.Amount), else_=-ledger.Amount))
+        ).filter(ledger.TransactionDate.isnot(None))
+        if as_of:
+            expected = expected.filter(ledger.TransactionDate <= as_of)
+        expected = dict(expected.group_by(account).all())
+        actual = {code: amount for code, amount, _ in account_balances(as_of)}
+        differ = sorted(code for code in expected.keys() | actual.keys() if expected.get(code) != actual.get(code))
+        click.echo(f"{'FAIL' if differ else 'ok  '} {len(expected)} account balances"
+                   f"{f' as of {as_of}' if as_of else ''} against the ledger")
+        wrong += differ
+    
+    # Backdate an entry before the first day of the account with most days
+    balance = AccountDailyBalance
+    code, first_day, days = db.session.query(
+        balance.AccountCode, func.min(balance.BalanceDate), func.count()
+    ).group_by(balance.AccountCode).order_by(func.count().desc(), balance.AccountCode).first()
+    day = first_day - timedelta(days=1)
+    
+    def balance_on(as_of):
+        return next((amount for _, amount, _ in account_balances(as_of, code)), None)
+    
+    before = balance_on(None)
+    tables = (AccountDailyBalance.__tablename__, AccountPeriodChange.__tablename__, AccountBalance.__tablename__)
+    written = []
+    
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if any(table in statement for table in tables) and not statement.lstrip().upper().startswith('SELECT'):
+            written.append(max(cursor.rowcount, 0))
+    
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+    try:
+        track_financial_record(FinancialRecord(
+            TransactionDate=day, TransactionType='Income', AccountCode=code or None, Amount=Decimal('10.00')
+        ))
+        after = balance_on(None)
+        on_day = balance_on(day)
+    finally:
+        event.remove(Engine, 'after_cursor_execute', after_cursor_execute)
+        db.session.rollback()
+    backdate_failed = sum(written) != 4 or after != before + 10 or on_day != 10
+    click.echo(f"{'FAIL' if backdate_failed else 'ok  '} entry backdated before {days} days of account "
+               f"'{code}': wrote {sum(written)} balance rows")
+    
+    if wrong:
+        raise click.ClickException(f"{len(wrong)} account balances differ from the ledger "
+                                   f"(e.g. '{wrong[0]}'); run `flask rebuild-rollups`")
+    if backdate_failed:
+        raise click.ClickException("A backdated entry must write its own day, month, year and balance rows "
+                                   "and nothing else")
+
+def register_commands(app):
+    """Attach the maintenance commands to the Flask CLI"""
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(check_query_counts_command)
+    app.cli.add_command(check_import_statements_command)
+    app.cli.add_command(check_balances_command)
@@ -0,0 +1,218 @@
+"""
+Database engine configuration driven by environment variables
+"""
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from flask import g, request, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, create_engine, orm
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+# PRAGMAs applied to every new SQLite connection, by SQLITE_PRAGMA_PROFILE
+SQLITE_PROFILES = {
+    # WAL lets readers in other gunicorn workers proceed while one writes;
+    # NORMAL sync is durable across application crashes in WAL mode
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': '5000',
+        'cache_size': '-20000',
+        'mmap_size': '268435456',
+        'temp_store': 'MEMORY'
+    },
+    # SQLite's built-in defaults
+    'default': {}
+}
+
+SQLITE_PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store')
+
+PRAGMA_VALUE = re.compile(r'^-?[A-Za-z0-9]+$')
+
+# Methods that never write; their requests may be served by a read replica
+READ_METHODS = ('GET', 'HEAD')
+
+# Cookie marking a client that wrote recently and must read from the primary
+READ_PRIMARY_COOKIE = 'read_primary_until'
+
+def absolute_sqlite_url(url):
+    """Resolve a relative sqlite:/// path against the working directory"""
+    if url.startswith('sqlite:///'):
+        db_path = url.replace('sqlite:///', '')
+        if not os.path.isabs(db_path):
+            return f'sqlite:///{os.path.abspath(db_path)}'
+    return url
+
+def sqlite_pragmas_from_env():
+    """Resolve the pragma profile plus per-pragma SQLITE_<NAME> overrides"""
+    profile = os.getenv('SQLITE_PRAGMA_PROFILE', 'production').lower()
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown SQLITE_PRAGMA_PROFILE '{profile}'. Use one of: {', '.join(SQLITE_PROFILES)}")
+    
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for name in SQLITE_PRAGMAS:
+        value = os.getenv(f'SQLITE_{name.upper()}')
+        if value:
+            pragmas[name] = value
+    
+    for name, value in pragmas.items():
+        if not PRAGMA_VALUE.match(value):
+            raise ValueError(f"Invalid value for SQLite pragma {name}: {value}")
+    return pragmas
+
+def install_sqlite_pragmas(pragmas):
+    """Apply `pragmas` to every SQLite connection any engine opens"""
+    @event.listens_for(Engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+def describe_database(db):
+    """One-line summary of the effective database settings for the startup log"""
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        pool = engine.pool
+        return (f"Database: {engine.dialect.name} ({engine.url.render_as_string(hide_password=True)}) "
+                f"pool={type(pool).__name__} size={pool.size()} max_overflow={pool._max_overflow} "
+                f"timeout={pool._timeout} recycle={pool._recycle} pre_ping={pool._pre_ping}")
+    
+    with engine.connect() as conn:
+        settings = ' '.join(
+            f"{name}={conn.exec_driver_sql(f'PRAGMA {name}').scalar()}" for name in SQLITE_PRAGMAS
+        )
+    return f"Database: sqlite ({engine.url.database}) {settings}"
+
+class PoolMetrics:
+    """Process-local counters for connection pool checkouts"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+    
+    def record(self, waited, timed_out=False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+    
+    def snapshot(self, pool=None):
+        with self.lock:
+            stats = {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6)
+            }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                'size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow()
+            })
+        return stats
+
+pool_metrics = PoolMetrics()
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except TimeoutError:
+            pool_metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_metrics.record(time.perf_counter() - start)
+        return connection
+
+def _env_flag(name, default):
+    return os.getenv(name, str(default)).lower() in ('1', 'true', 'yes')
+
+def engine_options_from_env(database_url):
+    """SQLALCHEMY_ENGINE_OPTIONS for server databases, from DB_POOL_* variables"""
+    if database_url.startswith('sqlite'):
+        return {}
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', True)
+    }
+
+class RoutingSession(SignallingSession):
+    """Session that sends reads to a replica when the request allows it.
+
+    Anything flushed goes to the primary, as does every query outside a
+    replica-eligible request (see RoutingSQLAlchemy).
+    """
+    
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not self._flushing and has_app_context():
+            replica = g.get('read_replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy extension with optional read replicas.
+
+    Replica URLs come from SQLALCHEMY_READ_URIS. GET/HEAD requests pick
+    one replica for their whole lifetime, unless the client wrote within
+    the last READ_YOUR_WRITES_SECONDS (tracked with a cookie), in which
+    case they stay on the primary so they see their own changes.
+    """
+    
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+    
+    def init_app(self, app):
+        super().init_app(app)
+        urls = app.config.setdefault('SQLALCHEMY_READ_URIS', [])
+        app.config.setdefault('READ_YOUR_WRITES_SECONDS', 5)
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        app.extensions['read_replicas'] = [create_engine(url, **options) for url in urls]
+        app.before_request(self._route_request)
+        app.after_request(self._remember_write)
+    
+    def read_replicas(self, app=None):
+        app = self.get_app(app)
+        return app.extensions.get('read_replicas', [])
+    
+    def _route_request(self):
+        replicas = self.read_replicas()
+        if not replicas or request.method not in READ_METHODS:
+            return
+        try:
+            primary_until = float(request.cookies.get(READ_PRIMARY_COOKIE, 0))
+        except ValueError:
+            primary_until = 0
+        if primary_until > time.time():
+            return
+        g.read_replica = random.choice(replicas)
+    
+    def _remember_write(self, response):
+        if self.read_replicas() and request.method not in READ_METHODS + ('OPTIONS',) \
+                and response.status_code < 400:
+            window = self.get_app().config['READ_YOUR_WRITES_SECONDS']
+            response.set_cookie(READ_PRIMARY_COOKIE, str(time.time() + window),
+                                max_age=window, httponly=True, samesite='Lax')
+        return response
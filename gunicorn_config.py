@@ -1,16 +1,37 @@
 # Gunicorn configuration file for production deployment
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
 
 # Server socket
-bind = "127.0.0.1:6657"
+bind = os.getenv("GUNICORN_BIND", "127.0.0.1:6657")
 backlog = 2048
 
 # Worker processes
-workers = 4
-worker_class = "sync"
-worker_connections = 1000
+# GUNICORN_WORKER_PROFILE selects how each worker handles concurrency:
+#   sync    - one request at a time per worker
+#   gthread - a thread pool per worker (recommended, works with SQLite)
+#   gevent  - greenlets; needs `pip install gevent`, best with PostgreSQL/MySQL
+worker_profile = os.getenv("GUNICORN_WORKER_PROFILE", "sync").lower()
+if worker_profile not in ("sync", "gthread", "gevent"):
+    raise ValueError(f"Unknown GUNICORN_WORKER_PROFILE '{worker_profile}'. Use sync, gthread or gevent")
+
+workers = int(os.getenv("GUNICORN_WORKERS", 4))
+worker_class = worker_profile
+threads = int(os.getenv("GUNICORN_THREADS", 8)) if worker_profile == "gthread" else 1
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
 timeout = 120
 keepalive = 5
 
+# Every thread needs its own pooled connection, otherwise requests queue
+# on the pool instead of running concurrently (server databases only)
+if worker_profile == "gthread":
+    os.environ.setdefault("DB_POOL_SIZE", str(threads))
+elif worker_profile == "gevent":
+    os.environ.setdefault("DB_POOL_SIZE", "20")
+    os.environ.setdefault("DB_MAX_OVERFLOW", "30")
+
 # Restart workers after this many requests, to help prevent memory leaks
 max_requests = 1000
 max_requests_jitter = 50
@@ -39,3 +60,48 @@ tmp_upload_dir = None
 # keyfile = None
 # certfile = None
 
+
+# Server hooks
+def on_starting(server):
+    """Start /metrics from zero; workers of a previous run left their files behind"""
+    from metrics import clear_metrics_dir
+    path = os.getenv("METRICS_DIR", os.path.join("instance", "metrics"))
+    if os.path.isdir(path):
+        clear_metrics_dir(path)
+
+def post_fork(server, worker):
+    """Discard database connections inherited from the master process.
+
+    Only matters with preload_app, where the app (and its connection pool)
+    is created before forking; each worker must open its own sockets.
+    close=False drops the inherited pool without closing its connections,
+    which the master still owns (closing them from a worker would end the
+    master's sessions).
+    gevent workers also get their database driver patched here.
+    """
+    import sys
+    if worker_profile == "gevent":
+        _patch_database_driver(worker)
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        with app_module.app.app_context():
+            app_module.db.engine.dispose(close=False)
+            for replica in app_module.db.read_replicas():
+                replica.dispose(close=False)
+
+def _patch_database_driver(worker):
+    """Make psycopg2 yield to other greenlets while waiting on the server.
+
+    Pure-Python drivers (PyMySQL) are covered by gevent's monkey patching;
+    sqlite3 never yields, so SQLite deployments should prefer gthread.
+    """
+    database_url = os.getenv("DATABASE_URL", "sqlite")
+    if database_url.startswith("sqlite"):
+        worker.log.warning("gevent workers serialize SQLite access; use GUNICORN_WORKER_PROFILE=gthread")
+    elif database_url.startswith("postgres"):
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            worker.log.warning("psycogreen is not installed; PostgreSQL queries will block the worker")
+            return
+        patch_psycopg()
@@ -8,6 +8,7 @@ from models import (
     PurchaseOrder, PurchaseOrderInventory, Expense, Attendance, Schedule,
     PerformanceReview, DemandPlan, PayrollRecord
 )
+from routes.rollups import rebuild_rollups
 from datetime import datetime, timedelta
 from decimal import Decimal
 import random
@@ -302,6 +303,10 @@ def init_data():
         db.session.commit()
         print("Created additional financial records")
         
+        # 14. Build daily rollups for the trend charts
+        rebuild_rollups()
+        print("Built daily rollups")
+        
         print("\n" + "="*50)
         print("Data initialization completed successfully!")
         print("="*50)
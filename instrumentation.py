@@ -0,0 +1,114 @@
+"""
+Per-request SQL instrumentation: query count, database time and the
+slowest statements of each request
+"""
+import json
+import time
+from flask import g, request, has_request_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+class RequestQueryStats:
+    """SQL statements issued while handling one request"""
+
+    def __init__(self, keep=3):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.seconds = 0.0
+        self.keep = keep
+        self.slowest = []
+
+    def record(self, statement, parameters, seconds):
+        self.count += 1
+        self.seconds += seconds
+        if len(self.slowest) < self.keep or seconds > self.slowest[-1][0]:
+            self.slowest.append((seconds, statement, parameters))
+            self.slowest.sort(key=lambda entry: entry[0], reverse=True)
+            del self.slowest[self.keep:]
+
+def _format_parameters(parameters, limit=500):
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append((statement, time.perf_counter()))
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_started'].pop()[1]
+    if not has_request_context():
+        return
+    stats = g.get('query_stats')
+    if stats is None:
+        return
+    stats.record(statement, parameters, seconds)
+    if seconds * 1000 >= current_app.config['SLOW_QUERY_MS']:
+        current_app.logger.warning(
+            f"Slow query ({seconds * 1000:.1f}ms): {statement} "
+            f"parameters={_format_parameters(parameters)}"
+        )
+
+def _handle_error(exception_context):
+    """Drop the start time of a statement that failed; after_cursor_execute
+    only runs on success, and a stale entry would skew later timings on
+    this pooled connection"""
+    connection = exception_context.connection
+    started = connection.info.get('query_started') if connection is not None else None
+    if started and started[-1][0] is exception_context.statement:
+        started.pop()
+
+def install_query_instrumentation(app):
+    """Time every SQL statement and report per-request totals.
+
+    Each response gets a Server-Timing header (`db` with the query count,
+    `app` for the whole request) and one JSON log line. Statements slower
+    than SLOW_QUERY_MS are logged with their bound parameters; requests
+    slower than SLOW_REQUEST_MS, or issuing more than REQUEST_QUERY_LIMIT
+    statements (usually an N+1), log their slowest statements too.
+    Queries run while a streamed body is sent happen after the headers
+    and are not included.
+    """
+    app.config.setdefault('SLOW_QUERY_MS', 200)
+    app.config.setdefault('SLOW_REQUEST_MS', 1000)
+    app.config.setdefault('REQUEST_QUERY_LIMIT', 50)
+    app.config.setdefault('SLOWEST_QUERIES_KEPT', 3)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = RequestQueryStats(app.config['SLOWEST_QUERIES_KEPT'])
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        db_ms = stats.seconds * 1000
+        response.headers.add(
+            'Server-Timing', f'db;dur={db_ms:.2f};desc="{stats.count} queries", app;dur={total_ms:.2f}'
+        )
+
+        entry = {
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 2),
+            'queries': stats.count,
+            'db_ms': round(db_ms, 2)
+        }
+        too_slow = total_ms >= app.config['SLOW_REQUEST_MS']
+        too_many = stats.count > app.config['REQUEST_QUERY_LIMIT']
+        if too_slow or too_many:
+            entry['slowest'] = [
+                {'ms': round(seconds * 1000, 2), 'sql': statement, 'parameters': _format_parameters(parameters)}
+                for seconds, statement, parameters in stats.slowest
+            ]
+            app.logger.warning(json.dumps(entry))
+        else:
+            app.logger.info(json.dumps(entry))
+        return response
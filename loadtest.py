@@ -0,0 +1,193 @@
+"""
+Mixed read/write load test for the API
+
+Against a server that is already running:
+    python loadtest.py --url http://127.0.0.1:6657
+
+Or start gunicorn once per worker profile (each on a fresh copy of the
+database) and compare them side by side:
+    python loadtest.py --profiles sync,gthread
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from datetime import date
+
+# (weight, method, path) - mostly reads, a slow export and a share of writes
+READS = [
+    (30, 'GET', '/api/dashboard/bundle'),
+    (10, 'GET', '/api/dashboard/overview'),
+    (10, 'GET', '/api/dashboard/top-donors?limit=10'),
+    (20, 'GET', '/api/financial/records?limit=50'),
+    (15, 'GET', '/api/donation/donations?limit=50'),
+    (10, 'GET', '/api/staff/attendance?limit=50'),
+    (5, 'GET', '/api/financial/records/export?format=csv'),
+]
+WRITES = [
+    (70, 'POST', '/api/financial/records'),
+    (30, 'POST', '/api/donation/donors'),
+]
+
+def write_body(path):
+    """Request body for one of the WRITES endpoints"""
+    if path == '/api/financial/records':
+        return {
+            'type': random.choice(['Income', 'Expense']),
+            'amount': round(random.uniform(10, 500), 2),
+            'date': date.today().isoformat(),
+            'description': 'load test'
+        }
+    return {'name': f'Load Test {random.randint(1, 10 ** 6)}', 'region': random.choice(['North', 'South'])}
+
+def pick(weighted):
+    return random.choices(weighted, weights=[w for w, _, _ in weighted])[0]
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (ms) for one run"""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0
+    }
+
+def request(base_url, method, path, timeout=60):
+    """Send one request and return (seconds, ok)"""
+    data = None
+    headers = {}
+    if method != 'GET':
+        data = json.dumps(write_body(path)).encode()
+        headers['Content-Type'] = 'application/json'
+    req = urllib.request.Request(base_url + path, data=data, headers=headers, method=method)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            ok = response.status < 400
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+def run_load(base_url, clients, duration, write_ratio):
+    """Drive `clients` concurrent loops for `duration` seconds"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        local_latencies = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            _, method, path = pick(WRITES if random.random() < write_ratio else READS)
+            seconds, ok = request(base_url, method, path)
+            local_latencies.append(seconds)
+            if not ok:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - start)
+
+def wait_until_up(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + '/api/pool-stats', timeout=2):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f'Server at {base_url} did not come up within {timeout}s')
+
+@contextmanager
+def gunicorn_server(database_url, port, workdir, profile='sync', workers=2, threads=None):
+    """Serve app:app with gunicorn on 127.0.0.1:`port` for the duration of
+    the with block, yielding its base URL; logs go to workdir/<profile>.log"""
+    env = dict(
+        os.environ,
+        GUNICORN_WORKER_PROFILE=profile,
+        GUNICORN_WORKERS=str(workers),
+        DATABASE_URL=database_url
+    )
+    if threads:
+        env['GUNICORN_THREADS'] = str(threads)
+
+    server = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py',
+        '--bind', f'127.0.0.1:{port}',
+        '--access-logfile', os.devnull,
+        '--error-logfile', os.path.join(workdir, f'{profile}.log'),
+        '--pid', os.path.join(workdir, f'{profile}.pid'),
+        'app:app'
+    ], cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        wait_until_up(base_url)
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def run_profile(profile, args, workdir):
+    """Start gunicorn with GUNICORN_WORKER_PROFILE=profile, load it, stop it"""
+    database = os.path.join(workdir, f'{profile}.db')
+    shutil.copyfile(args.database, database)
+    database_url = f'sqlite:///{database}' if args.database_url is None else args.database_url
+    with gunicorn_server(database_url, args.port, workdir, profile, args.workers, args.threads) as base_url:
+        return run_load(base_url, args.clients, args.duration, args.write_ratio)
+
+def main():
+    parser = argparse.ArgumentParser(description='Mixed read/write load test')
+    parser.add_argument('--url', help='Load an already running server instead of starting gunicorn')
+    parser.add_argument('--profiles', default='sync,gthread',
+                        help='Comma-separated GUNICORN_WORKER_PROFILE values to compare (default: sync,gthread)')
+    parser.add_argument('--database', default=os.path.join('instance', 'mis_database.db'),
+                        help='SQLite database copied fresh for each profile')
+    parser.add_argument('--database-url', help='Use this database instead of a SQLite copy (it will be written to)')
+    parser.add_argument('--port', type=int, default=6680)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, help='GUNICORN_THREADS for gthread workers')
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent client loops')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per run')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of requests that are writes')
+    args = parser.parse_args()
+
+    if args.url:
+        results = {args.url: run_load(args.url.rstrip('/'), args.clients, args.duration, args.write_ratio)}
+    else:
+        results = {}
+        with tempfile.TemporaryDirectory() as workdir:
+            for profile in args.profiles.split(','):
+                print(f'Running {profile} workers for {args.duration:g}s...', file=sys.stderr)
+                results[profile] = run_profile(profile.strip(), args, workdir)
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
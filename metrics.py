@@ -0,0 +1,333 @@
+"""
+Prometheus metrics, aggregated across gunicorn worker processes
+
+Each process keeps its own counters in memory and a background thread
+writes them to METRICS_DIR/<pid>.json every METRICS_FLUSH_SECONDS. /metrics
+merges the files of every process: counters and histograms are summed
+over all of them (including exited workers, so totals never go
+backwards), gauges only over processes that are still alive. The files
+of exited workers are folded into METRICS_DIR/retired.json and removed,
+so the directory holds one file per live worker plus that one.
+"""
+import glob
+import json
+import os
+import threading
+import time
+try:
+    import fcntl
+except ImportError:  # Windows, where gunicorn (and so worker churn) does not run
+    fcntl = None
+from flask import g, request
+from sqlalchemy import select, func, literal, union_all
+from models import db
+from database import pool_metrics
+from routes.cache import response_cache, LRUCache
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Counters of exited workers, merged out of their <pid>.json files
+RETIRED_FILE = 'retired.json'
+
+# Tables whose row counts are exported, counted at most every
+# METRICS_ROW_COUNT_TTL seconds per process
+ROW_COUNT_TABLES = (
+    'financial_record', 'expense', 'payroll_record', 'donation', 'donor',
+    'inventory', 'purchase_order', 'supplier', 'staff', 'attendance', 'schedule'
+)
+
+class ProcessMetrics:
+    """Request counters and latency histograms of the current process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.in_flight = 0
+        self.flusher_pid = None
+
+    def start(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def finish(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def observe(self, blueprint, endpoint, method, status, seconds):
+        with self.lock:
+            key = (blueprint, endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            histogram = self.latency.setdefault((blueprint, endpoint), [0] * (len(LATENCY_BUCKETS) + 2))
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+    def snapshot(self):
+        """JSON-serializable state of this process"""
+        with self.lock:
+            return {
+                'requests': [list(key) + [count] for key, count in self.requests.items()],
+                'latency': [list(key) + [values] for key, values in self.latency.items()],
+                'in_flight': self.in_flight,
+                'pool': pool_metrics.snapshot(db.engine.pool),
+                'cache': response_cache.stats()
+            }
+
+    def flush(self, directory):
+        """Write this process's snapshot to directory/<pid>.json"""
+        _write_snapshot(os.path.join(directory, f'{os.getpid()}.json'), self.snapshot())
+
+    def ensure_flusher(self, app):
+        """Start the flush thread of this process (once per forked worker)"""
+        with self.lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+        interval = float(os.getenv('METRICS_FLUSH_SECONDS', 1))
+
+        def run():
+            while True:
+                time.sleep(interval)
+                with app.app_context():
+                    self.flush(metrics_dir(app))
+
+        threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+process_metrics = ProcessMetrics()
+
+def metrics_dir(app):
+    path = app.config['METRICS_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def clear_metrics_dir(path):
+    """Remove the files of a previous run; call once before workers start"""
+    for filename in glob.glob(os.path.join(path, '*.json')):
+        os.remove(filename)
+
+def install_metrics(app):
+    """Record request counts, latency and in-flight requests per route"""
+    app.config.setdefault('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+    app.config.setdefault('METRICS_ROW_COUNT_TTL', 60)
+
+    @app.before_request
+    def start_request_metrics():
+        process_metrics.ensure_flusher(app)
+        g.metrics_started = time.perf_counter()
+        process_metrics.start()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('metrics_started')
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            process_metrics.observe(request.blueprint or 'app', endpoint, request.method,
+                                    response.status_code, time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        if g.pop('metrics_started', None) is not None:
+            process_metrics.finish()
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_snapshot(path, snapshot):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(path + '.tmp', path)
+
+def _load_snapshots(directory):
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        snapshot = _read_snapshot(path)
+        if snapshot is None:
+            continue
+        name = os.path.basename(path)[:-len('.json')]
+        snapshot['pid'] = int(name) if name.isdigit() else None
+        snapshot['alive'] = snapshot['pid'] is not None and _alive(snapshot['pid'])
+        snapshots.append(snapshot)
+    return snapshots
+
+def _empty_snapshot():
+    return {
+        'requests': [], 'latency': [], 'in_flight': 0,
+        'pool': {'checkouts': 0, 'timeouts': 0, 'wait_seconds_total': 0.0},
+        'cache': {'hits': 0, 'misses': 0},
+        'merged_pids': []
+    }
+
+def _merge_counters(total, snapshot):
+    """Add the counters and histograms of `snapshot` (not its gauges) to `total`"""
+    requests = {tuple(row[:-1]): row[-1] for row in total['requests']}
+    for *key, count in snapshot['requests']:
+        requests[tuple(key)] = requests.get(tuple(key), 0) + count
+    total['requests'] = [list(key) + [count] for key, count in requests.items()]
+
+    latency = {(blueprint, endpoint): values for blueprint, endpoint, values in total['latency']}
+    for blueprint, endpoint, values in snapshot['latency']:
+        merged = latency.setdefault((blueprint, endpoint), [0] * len(values))
+        for i, value in enumerate(values):
+            merged[i] += value
+    total['latency'] = [[blueprint, endpoint, values] for (blueprint, endpoint), values in latency.items()]
+
+    for section, keys in (('pool', ('checkouts', 'timeouts', 'wait_seconds_total')), ('cache', ('hits', 'misses'))):
+        for key in keys:
+            total[section][key] += snapshot[section].get(key, 0)
+
+def retire_dead_workers(directory, snapshots):
+    """Fold the files of exited workers into RETIRED_FILE and delete them.
+
+    Returns whether any were retired. Scrapes of several workers take
+    turns through a lock file; a scrape that finds it held skips this.
+    `merged_pids` records the files merged before their deletion, so a
+    crash between the two cannot count a worker twice.
+    """
+    if fcntl is None or not any(s['pid'] is not None and not s['alive'] for s in snapshots):
+        return False
+    with open(os.path.join(directory, 'retired.lock'), 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        path = os.path.join(directory, RETIRED_FILE)
+        retired = _read_snapshot(path) or _empty_snapshot()
+        merged = set(retired['merged_pids'])
+        # Re-read under the lock: another scrape may have retired some already
+        dead = [s['pid'] for s in snapshots if s['pid'] is not None and not s['alive']]
+        for pid in dead:
+            snapshot = _read_snapshot(os.path.join(directory, f'{pid}.json'))
+            if snapshot is not None and pid not in merged:
+                _merge_counters(retired, snapshot)
+                merged.add(pid)
+        retired['merged_pids'] = sorted(merged)
+        _write_snapshot(path, retired)
+        for pid in dead:
+            try:
+                os.remove(os.path.join(directory, f'{pid}.json'))
+            except FileNotFoundError:
+                pass
+        retired['merged_pids'] = []
+        _write_snapshot(path, retired)
+    return True
+
+def _labels(**labels):
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                          for k, v in labels.items()) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def table_row_counts():
+    """Row counts of ROW_COUNT_TABLES in one round trip"""
+    tables = db.metadata.tables
+    query = union_all(*[
+        select(literal(name).label('name'), func.count().label('rows')).select_from(tables[name])
+        for name in ROW_COUNT_TABLES
+    ])
+    return dict(db.session.execute(query).all())
+
+# The last table_row_counts() of this process
+row_counts_cache = LRUCache(max_entries=1)
+
+def cached_row_counts(app):
+    """table_row_counts(), reused for METRICS_ROW_COUNT_TTL seconds so a
+    scrape does not COUNT(*) every table each time"""
+    counts = row_counts_cache.get('rows')
+    if counts is None:
+        counts = table_row_counts()
+        row_counts_cache.set('rows', counts, app.config['METRICS_ROW_COUNT_TTL'])
+    return counts
+
+def render_metrics(app):
+    """All metrics in the Prometheus text exposition format"""
+    directory = metrics_dir(app)
+    process_metrics.flush(directory)
+    snapshots = _load_snapshots(directory)
+    if retire_dead_workers(directory, snapshots):
+        snapshots = _load_snapshots(directory)
+    live = [s for s in snapshots if s['alive']]
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix, labels, value in samples:
+            lines.append(f'{name}{suffix}{_labels(**labels) if labels else ""} {_number(value)}')
+
+    requests = {}
+    latency = {}
+    for snapshot in snapshots:
+        for blueprint, endpoint, method, status, count in snapshot['requests']:
+            key = (blueprint, endpoint, method, status)
+            requests[key] = requests.get(key, 0) + count
+        for blueprint, endpoint, values in snapshot['latency']:
+            merged = latency.setdefault((blueprint, endpoint), [0] * len(values))
+            for i, value in enumerate(values):
+                merged[i] += value
+
+    metric('ecf_http_requests_total', 'counter', 'HTTP requests by route and status', [
+        ('', {'blueprint': bp, 'endpoint': ep, 'method': method, 'status': status}, count)
+        for (bp, ep, method, status), count in sorted(requests.items())
+    ])
+
+    samples = []
+    for (bp, ep), values in sorted(latency.items()):
+        for bound, count in zip(LATENCY_BUCKETS, values):
+            samples.append(('_bucket', {'blueprint': bp, 'endpoint': ep, 'le': bound}, count))
+        samples.append(('_bucket', {'blueprint': bp, 'endpoint': ep, 'le': '+Inf'}, values[-2]))
+        samples.append(('_count', {'blueprint': bp, 'endpoint': ep}, values[-2]))
+        samples.append(('_sum', {'blueprint': bp, 'endpoint': ep}, round(values[-1], 6)))
+    metric('ecf_http_request_duration_seconds', 'histogram', 'HTTP request latency by route', samples)
+
+    metric('ecf_http_requests_in_flight', 'gauge', 'Requests currently being handled',
+           [('', None, sum(s['in_flight'] for s in live))])
+
+    pools = [s['pool'] for s in snapshots]
+    metric('ecf_db_pool_checkouts_total', 'counter', 'Database connections checked out of the pool',
+           [('', None, sum(p['checkouts'] for p in pools))])
+    metric('ecf_db_pool_timeouts_total', 'counter', 'Pool checkouts that timed out',
+           [('', None, sum(p['timeouts'] for p in pools))])
+    metric('ecf_db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a pooled connection',
+           [('', None, round(sum(p['wait_seconds_total'] for p in pools), 6))])
+    live_pools = [s['pool'] for s in live if 'checked_out' in s['pool']]
+    if live_pools:
+        metric('ecf_db_pool_checked_out', 'gauge', 'Connections currently checked out',
+               [('', None, sum(p['checked_out'] for p in live_pools))])
+        metric('ecf_db_pool_size', 'gauge', 'Configured pool size, summed over workers',
+               [('', None, sum(p['size'] for p in live_pools))])
+
+    caches = [s['cache'] for s in snapshots]
+    hits = sum(c['hits'] for c in caches)
+    misses = sum(c['misses'] for c in caches)
+    metric('ecf_response_cache_hits_total', 'counter', 'Dashboard response cache hits', [('', None, hits)])
+    metric('ecf_response_cache_misses_total', 'counter', 'Dashboard response cache misses', [('', None, misses)])
+    metric('ecf_response_cache_hit_ratio', 'gauge', 'Hits over lookups since start',
+           [('', None, round(hits / (hits + misses), 4) if hits + misses else 0.0)])
+
+    metric('ecf_table_rows', 'gauge', 'Rows in the core tables', [
+        ('', {'table': name}, rows) for name, rows in sorted(cached_row_counts(app).items())
+    ])
+    metric('ecf_worker_processes', 'gauge', 'Processes currently reporting metrics',
+           [('', None, len(live))])
+
+    return '\n'.join(lines) + '\n'
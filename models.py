@@ -1,7 +1,29 @@
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from database import RoutingSQLAlchemy
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+
+class Money(db.TypeDecorator):
+    """Monetary amount stored as an integer number of cents.
+
+    Binds anything Decimal() accepts (rounded half-up to the cent) and
+    returns Decimals with two places. SUMs run on integers, so they are
+    exact on every backend, and the range is not capped by NUMERIC(10, 2).
+    """
+    impl = db.BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int((Decimal(str(value)) * 100).to_integral_value(ROUND_HALF_UP))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # AVG over cents comes back fractional
+        return Decimal(value if isinstance(value, int) else str(value)).scaleb(-2)
 
 # Inventory Management Models
 class DemandPlan(db.Model):
@@ -35,9 +57,13 @@ class Supplier(db.Model):
 
 class PurchaseOrder(db.Model):
     __tablename__ = 'purchase_order'
+    __table_args__ = (
+        db.Index('ix_purchase_order_order_date', 'OrderDate'),
+        db.Index('ix_purchase_order_status_order_date', 'Status', 'OrderDate'),
+    )
     PurchaseOrderID = db.Column(db.Integer, primary_key=True)
     OrderDate = db.Column(db.Date, nullable=False, default=datetime.utcnow)
-    TotalAmount = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    TotalAmount = db.Column(Money, nullable=False, default=0)
     Status = db.Column(db.String(50), default='Pending')
     SupplierID = db.Column(db.Integer, db.ForeignKey('supplier.SupplierID'), nullable=False)
     DemandPlanID = db.Column(db.Integer, db.ForeignKey('demand_plan.DemandPlanID'), nullable=True)
@@ -54,11 +80,15 @@ class PurchaseOrderInventory(db.Model):
 # Financial Management Models
 class FinancialRecord(db.Model):
     __tablename__ = 'financial_record'
+    __table_args__ = (
+        db.Index('ix_financial_record_transaction_date', 'TransactionDate'),
+        db.Index('ix_financial_record_type_date', 'TransactionType', 'TransactionDate'),
+    )
     FinancialRecordID = db.Column(db.Integer, primary_key=True)
     TransactionDate = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     TransactionType = db.Column(db.String(50), nullable=False)  # Income, Expense, Donation, etc.
     AccountCode = db.Column(db.String(50))
-    Amount = db.Column(db.Numeric(10, 2), nullable=False)
+    Amount = db.Column(Money, nullable=False)
     Description = db.Column(db.Text)
     
     purchase_orders = db.relationship('PurchaseOrderFinancialRecord', backref='financial_record', lazy=True, cascade='all, delete-orphan')
@@ -72,9 +102,13 @@ class PurchaseOrderFinancialRecord(db.Model):
 
 class PayrollRecord(db.Model):
     __tablename__ = 'payroll_record'
+    __table_args__ = (
+        db.Index('ix_payroll_record_payment_date', 'PaymentDate'),
+        db.Index('ix_payroll_record_staff_payment_date', 'StaffID', 'PaymentDate'),
+    )
     PayrollRecordID = db.Column(db.Integer, primary_key=True)
     PayPeriod = db.Column(db.String(50), nullable=False)
-    Amount = db.Column(db.Numeric(10, 2), nullable=False)
+    Amount = db.Column(Money, nullable=False)
     PaymentDate = db.Column(db.Date, nullable=False)
     StaffID = db.Column(db.Integer, db.ForeignKey('staff.StaffID'), nullable=False)
     
@@ -87,16 +121,100 @@ class PayrollFinancialRecord(db.Model):
 
 class Expense(db.Model):
     __tablename__ = 'expense'
+    __table_args__ = (
+        db.Index('ix_expense_date', 'Date'),
+    )
     ExpenseID = db.Column(db.Integer, primary_key=True)
     Date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     Type = db.Column(db.String(100), nullable=False)
-    Amount = db.Column(db.Numeric(10, 2), nullable=False)
+    Amount = db.Column(Money, nullable=False)
     Description = db.Column(db.Text)
     StaffID = db.Column(db.Integer, db.ForeignKey('staff.StaffID'), nullable=True)
 
+# Daily rollups of FinancialRecord / Donation, maintained by the write routes
+class FinancialDailyRollup(db.Model):
+    __tablename__ = 'financial_daily_rollup'
+    RollupDate = db.Column(db.Date, primary_key=True)
+    TransactionType = db.Column(db.String(50), primary_key=True)
+    RecordCount = db.Column(db.Integer, nullable=False, default=0)
+    TotalAmount = db.Column(Money, nullable=False, default=0)
+
+class DonationDailyRollup(db.Model):
+    __tablename__ = 'donation_daily_rollup'
+    RollupDate = db.Column(db.Date, primary_key=True)
+    DonationType = db.Column(db.String(50), primary_key=True)
+    RecordCount = db.Column(db.Integer, nullable=False, default=0)
+    TotalAmount = db.Column(Money, nullable=False, default=0)
+
+# Net change of each AccountCode's balance, one row per day with ledger
+# entries: income types count positive and everything else negative
+class AccountDailyBalance(db.Model):
+    __tablename__ = 'account_daily_balance'
+    AccountCode = db.Column(db.String(50), primary_key=True)  # '' for entries without one
+    BalanceDate = db.Column(db.Date, primary_key=True)
+    RecordCount = db.Column(db.Integer, nullable=False, default=0)
+    DayAmount = db.Column(Money, nullable=False, default=0)
+
+# The same net change per account and month and per account and year
+class AccountPeriodChange(db.Model):
+    __tablename__ = 'account_period_change'
+    AccountCode = db.Column(db.String(50), primary_key=True)
+    Period = db.Column(db.String(5), primary_key=True)  # 'month' or 'year'
+    PeriodStart = db.Column(db.Date, primary_key=True)
+    RecordCount = db.Column(db.Integer, nullable=False, default=0)
+    Amount = db.Column(Money, nullable=False, default=0)
+
+# Balance of each account over all its entries. A balance as of a date is
+# this less the changes after it: the later years, the later months of its
+# year and the later days of its month (see routes/aggregates.py)
+class AccountBalance(db.Model):
+    __tablename__ = 'account_balance'
+    AccountCode = db.Column(db.String(50), primary_key=True)
+    RecordCount = db.Column(db.Integer, nullable=False, default=0)
+    Balance = db.Column(Money, nullable=False, default=0)
+
+# Closed accounting periods (month, quarter or year) and the ledger totals
+# frozen when they were closed, per month and type and per month, type and
+# account code (see routes/periods.py)
+class FinancialPeriod(db.Model):
+    __tablename__ = 'financial_period'
+    PeriodStart = db.Column(db.Date, primary_key=True)
+    PeriodEnd = db.Column(db.Date, nullable=False)
+    Period = db.Column(db.String(10), nullable=False, unique=True)  # 2024-03, 2024-Q1 or 2024
+    ClosedAt = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class FinancialPeriodSnapshot(db.Model):
+    __tablename__ = 'financial_period_snapshot'
+    MonthStart = db.Column(db.Date, primary_key=True)
+    TransactionType = db.Column(db.String(50), primary_key=True)
+    RecordCount = db.Column(db.Integer, nullable=False, default=0)
+    TotalAmount = db.Column(Money, nullable=False, default=0)
+
+class FinancialPeriodAccountSnapshot(db.Model):
+    __tablename__ = 'financial_period_account_snapshot'
+    __table_args__ = (
+        db.Index('ix_financial_period_account_snapshot_month', 'MonthStart'),
+    )
+    SnapshotID = db.Column(db.Integer, primary_key=True)
+    MonthStart = db.Column(db.Date, nullable=False)
+    TransactionType = db.Column(db.String(50), nullable=False)
+    AccountCode = db.Column(db.String(50))
+    RecordCount = db.Column(db.Integer, nullable=False, default=0)
+    TotalAmount = db.Column(Money, nullable=False, default=0)
+
+# Change counters per table, bumped on every write (see routes/cache.py)
+class TableVersion(db.Model):
+    __tablename__ = 'table_version'
+    TableName = db.Column(db.String(100), primary_key=True)
+    Version = db.Column(db.Integer, nullable=False, default=0)
+
 # Donation Management Models
 class Donor(db.Model):
     __tablename__ = 'donor'
+    __table_args__ = (
+        db.Index('ix_donor_registration_date', 'RegistrationDate'),
+        db.Index('ix_donor_region_registration_date', 'Region', 'RegistrationDate'),
+    )
     DonorID = db.Column(db.Integer, primary_key=True)
     Name = db.Column(db.String(200), nullable=False)
     ContactInfo = db.Column(db.String(200))
@@ -117,10 +235,15 @@ class Gift(db.Model):
 
 class Donation(db.Model):
     __tablename__ = 'donation'
+    __table_args__ = (
+        db.Index('ix_donation_donation_date', 'DonationDate'),
+        db.Index('ix_donation_status_date', 'Status', 'DonationDate'),
+        db.Index('ix_donation_donor_date', 'DonorID', 'DonationDate'),
+    )
     DonationID = db.Column(db.Integer, primary_key=True)
     DonationType = db.Column(db.String(50), nullable=False)  # Monetary, Gift, etc.
     Status = db.Column(db.String(50), default='Pending')
-    Amount = db.Column(db.Numeric(10, 2), default=0)
+    Amount = db.Column(Money, default=0)
     DonationDate = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     DonorID = db.Column(db.Integer, db.ForeignKey('donor.DonorID'), nullable=False)
     StaffID = db.Column(db.Integer, db.ForeignKey('staff.StaffID'), nullable=True)
@@ -152,6 +275,10 @@ class Staff(db.Model):
 
 class Attendance(db.Model):
     __tablename__ = 'attendance'
+    __table_args__ = (
+        db.Index('ix_attendance_date', 'Date'),
+        db.Index('ix_attendance_staff_date', 'StaffID', 'Date'),
+    )
     AttendanceID = db.Column(db.Integer, primary_key=True)
     Date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     CheckIn = db.Column(db.Time)
@@ -161,6 +288,10 @@ class Attendance(db.Model):
 
 class Schedule(db.Model):
     __tablename__ = 'schedule'
+    __table_args__ = (
+        db.Index('ix_schedule_shift_date', 'ShiftDate'),
+        db.Index('ix_schedule_staff_shift_date', 'StaffID', 'ShiftDate'),
+    )
     ScheduleID = db.Column(db.Integer, primary_key=True)
     ShiftDate = db.Column(db.Date, nullable=False)
     ShiftType = db.Column(db.String(50))
@@ -0,0 +1,387 @@
+from collections import namedtuple
+from datetime import timedelta
+from sqlalchemy import select, func, case, cast, literal, type_coerce, and_, or_, Date, Integer, String
+from models import db, Money, FinancialRecord, Donation, Donor, Inventory, Staff, Expense, AccountDailyBalance, AccountPeriodChange, AccountBalance, FinancialPeriod, FinancialPeriodSnapshot, FinancialPeriodAccountSnapshot
+
+# Transaction types counted as income; everything else is treated as outgoing
+INCOME_TYPES = ('Income', 'Donation')
+
+# AccountDailyBalance key of ledger entries without an AccountCode
+UNASSIGNED_ACCOUNT = ''
+
+# AccountPeriodChange periods and the first day of the one containing a date
+BALANCE_PERIODS = (
+    ('month', lambda day: day.replace(day=1)),
+    ('year', lambda day: day.replace(month=1, day=1)),
+)
+
+# Inventory items below this quantity are reported as low stock
+LOW_STOCK_THRESHOLD = 10
+
+def sum_where(column, condition):
+    """SUM(CASE WHEN condition THEN column ELSE 0 END), never NULL"""
+    return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
+
+def scalar(query):
+    """Turn a single-value query into a scalar subquery usable as a column"""
+    return query.scalar_subquery()
+
+def overview_totals():
+    """Compute every dashboard overview figure in a single SQL round trip.
+
+    The financial sums are aggregated over financial_record directly; the
+    remaining counts and sums ride along as scalar subqueries, so the
+    result is always exactly one row regardless of table sizes.
+    """
+    return db.session.query(
+        sum_where(FinancialRecord.Amount, FinancialRecord.TransactionType.in_(INCOME_TYPES)).label('total_income'),
+        sum_where(FinancialRecord.Amount, FinancialRecord.TransactionType == 'Expense').label('total_expense'),
+        scalar(db.session.query(func.coalesce(func.sum(Donation.Amount), 0))).label('donation_total'),
+        scalar(db.session.query(func.count(Donation.DonationID))).label('donation_count'),
+        scalar(db.session.query(func.count(Donor.DonorID))).label('donor_count'),
+        scalar(db.session.query(func.count(Inventory.InventoryID))).label('inventory_count'),
+        scalar(db.session.query(func.count(Inventory.InventoryID)).filter(
+            Inventory.Quantity < LOW_STOCK_THRESHOLD
+        )).label('low_stock_count'),
+        scalar(db.session.query(func.count(Staff.StaffID)).filter(
+            Staff.Status == 'Active'
+        )).label('active_staff_count')
+    ).select_from(FinancialRecord).one()
+
+# Donor age bands; a missing (or zero) age is reported as Unknown
+AGE_GROUP = case(
+    (func.coalesce(Donor.Age, 0) == 0, 'Unknown'),
+    (Donor.Age <= 25, '0-25'),
+    (Donor.Age <= 40, '26-40'),
+    (Donor.Age <= 60, '41-60'),
+    else_='61+'
+)
+
+# A table that /aggregate can group: the date column that time buckets and
+# date filters apply to, the column the metrics are computed over, the
+# whitelisted dimensions, joins some dimensions need, and the tables read
+AggregationSource = namedtuple('AggregationSource', ['model', 'date_column', 'measure', 'dimensions', 'joins', 'tables'])
+
+AGGREGATION_SOURCES = {
+    'ledger': AggregationSource(
+        FinancialRecord, FinancialRecord.TransactionDate, FinancialRecord.Amount,
+        {'type': FinancialRecord.TransactionType, 'account_code': FinancialRecord.AccountCode},
+        {}, ('financial_record',)
+    ),
+    'expenses': AggregationSource(
+        Expense, Expense.Date, Expense.Amount,
+        {'type': Expense.Type, 'staff_id': Expense.StaffID},
+        {}, ('expense',)
+    ),
+    'donations': AggregationSource(
+        Donation, Donation.DonationDate, Donation.Amount,
+        {'type': Donation.DonationType, 'status': Donation.Status, 'region': Donor.Region, 'age_group': AGE_GROUP},
+        {'region': (Donor, Donation.DonorID == Donor.DonorID), 'age_group': (Donor, Donation.DonorID == Donor.DonorID)},
+        ('donation', 'donor')
+    ),
+    'donors': AggregationSource(
+        Donor, Donor.RegistrationDate, Donor.Age,
+        {'region': Donor.Region, 'age_group': AGE_GROUP},
+        {}, ('donor',)
+    ),
+}
+
+TIME_BUCKETS = ('day', 'week', 'month', 'quarter', 'year')
+
+# Totals frozen when a period was closed, standing in for a source's rows
+# in those months: the month a snapshot row covers, the dimensions it
+# keeps and its sum/count columns. A source lists its snapshot tables
+# smallest first; a query uses the first one keeping all its dimensions.
+SnapshotSource = namedtuple('SnapshotSource', ['model', 'date_column', 'dimensions', 'sum', 'count'])
+
+AGGREGATION_SNAPSHOTS = {
+    'ledger': [
+        SnapshotSource(
+            FinancialPeriodSnapshot, FinancialPeriodSnapshot.MonthStart,
+            {'type': FinancialPeriodSnapshot.TransactionType},
+            FinancialPeriodSnapshot.TotalAmount, FinancialPeriodSnapshot.RecordCount
+        ),
+        SnapshotSource(
+            FinancialPeriodAccountSnapshot, FinancialPeriodAccountSnapshot.MonthStart,
+            {'type': FinancialPeriodAccountSnapshot.TransactionType, 'account_code': FinancialPeriodAccountSnapshot.AccountCode},
+            FinancialPeriodAccountSnapshot.TotalAmount, FinancialPeriodAccountSnapshot.RecordCount
+        ),
+    ],
+}
+
+# Time buckets made of whole months, so month snapshots can fill them
+SNAPSHOT_BUCKETS = ('month', 'quarter', 'year')
+
+AGGREGATION_METRICS = {
+    'sum': lambda measure: func.coalesce(func.sum(measure), 0),
+    'count': lambda measure: func.count(),
+    'avg': func.avg,
+    'min': func.min,
+    'max': func.max,
+}
+
+def time_bucket(column, unit):
+    """First day of the `unit` period containing `column` (weeks start on Monday)"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return cast(func.date_trunc(unit, column), Date)
+    if dialect == 'mysql':
+        if unit == 'day':
+            return func.date(column)
+        if unit == 'week':
+            return func.subdate(column, func.weekday(column))
+        month = {'month': func.month(column), 'quarter': (func.quarter(column) - 1) * 3 + 1, 'year': 1}[unit]
+        return func.str_to_date(func.concat(func.year(column), '-', month, '-01'), '%Y-%c-%d')
+    # SQLite
+    if unit == 'day':
+        return func.date(column)
+    if unit == 'week':
+        weekday = (cast(func.strftime('%w', column), Integer) + 6) % 7
+        return func.date(column, literal('-') + cast(weekday, String) + ' days')
+    if unit == 'quarter':
+        months = (cast(func.strftime('%m', column), Integer) - 1) % 3
+        return func.date(column, 'start of month', literal('-') + cast(months, String) + ' months')
+    return func.date(column, f'start of {unit}')
+
+def next_month(day):
+    """First day of the month after `day`"""
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+def closed_ranges(start_date=None, end_date=None):
+    """(first, last) date ranges of the closed months lying wholly within
+    start_date..end_date (either may be None), adjacent ones merged"""
+    query = db.session.query(FinancialPeriod.PeriodStart, FinancialPeriod.PeriodEnd).order_by(FinancialPeriod.PeriodStart)
+    if start_date:
+        query = query.filter(FinancialPeriod.PeriodEnd >= start_date)
+    if end_date:
+        query = query.filter(FinancialPeriod.PeriodStart <= end_date)
+    
+    ranges = []
+    for first, last in query:
+        if start_date and first < start_date:
+            first = start_date if start_date.day == 1 else next_month(start_date)
+        if end_date and last > end_date:
+            last = end_date if next_month(end_date) == end_date + timedelta(days=1) else end_date.replace(day=1) - timedelta(days=1)
+        if first > last:
+            continue
+        if ranges and ranges[-1][1] + timedelta(days=1) == first:
+            ranges[-1] = (ranges[-1][0], last)
+        else:
+            ranges.append((first, last))
+    return ranges
+
+def _open_ranges(start_date, end_date, closed):
+    """The parts of start_date..end_date not covered by the `closed` ranges"""
+    ranges = []
+    first = start_date
+    for closed_first, closed_last in closed:
+        if first is None or first < closed_first:
+            ranges.append((first, closed_first - timedelta(days=1)))
+        first = closed_last + timedelta(days=1)
+    if first is None or end_date is None or first <= end_date:
+        ranges.append((first, end_date))
+    return ranges
+
+def _date_range(column, first, last):
+    conditions = []
+    if first:
+        conditions.append(column >= first)
+    if last:
+        conditions.append(column <= last)
+    return and_(*conditions)
+
+def _snapshot_rows(snapshot, group_by, metrics, closed):
+    """Grouped sum/count rows of the snapshots covering the `closed` ranges"""
+    groups = [
+        (time_bucket(snapshot.date_column, name) if name in TIME_BUCKETS else snapshot.dimensions[name]).label(name)
+        for name in group_by
+    ]
+    values = {
+        'sum': type_coerce(func.coalesce(func.sum(snapshot.sum), 0), snapshot.sum.type),
+        'count': func.coalesce(func.sum(snapshot.count), 0),
+    }
+    query = db.session.query(*groups, *[values[name].label(name) for name in metrics]).select_from(
+        snapshot.model
+    ).filter(or_(*[snapshot.date_column.between(first, last) for first, last in closed]))
+    if groups:
+        query = query.group_by(*groups)
+    return query.all()
+
+def _merge_rows(rows, width):
+    """Add up the metrics of rows whose first `width` (group) values are
+    equal, ordered by those values with NULLs first like SQLite"""
+    merged = {}
+    for row in rows:
+        key = tuple(row[:width])
+        if key in merged:
+            merged[key] = [total + value for total, value in zip(merged[key], row[width:])]
+        else:
+            merged[key] = list(row[width:])
+    ordered = sorted(merged.items(), key=lambda item: [(value is not None, value) for value in item[0]])
+    return [key + tuple(values) for key, values in ordered]
+
+def _metric_value(name, value):
+    if name == 'count':
+        return value
+    return float(value) if value is not None else None
+
+def _bucket_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def aggregate(source, group_by=(), metrics=('sum', 'count'), start_date=None, end_date=None):
+    """Group `source` by `group_by` and compute `metrics` over its measure in one query.
+
+    `group_by` takes the source's dimensions and the TIME_BUCKETS over its
+    date column; `start_date`/`end_date` bound that column inclusively.
+    Returns one dict per group, keyed by dimension and metric names,
+    ordered by the group values.
+
+    Sums and counts of a source in AGGREGATION_SNAPSHOTS read closed
+    months from its snapshots and only the open months from the source
+    table, provided a snapshot table keeps every group.
+    """
+    if source not in AGGREGATION_SOURCES:
+        raise ValueError(f"Unknown source '{source}'. Allowed: {', '.join(AGGREGATION_SOURCES)}")
+    spec = AGGREGATION_SOURCES[source]
+    allowed = list(spec.dimensions) + list(TIME_BUCKETS)
+    unknown = [name for name in group_by if name not in allowed]
+    if unknown:
+        raise ValueError(f"Cannot group {source} by '{', '.join(unknown)}'. Allowed: {', '.join(allowed)}")
+    unknown = [name for name in metrics if name not in AGGREGATION_METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metric '{', '.join(unknown)}'. Allowed: {', '.join(AGGREGATION_METRICS)}")
+    if not metrics:
+        raise ValueError("At least one metric is required")
+
+    groups = [
+        (time_bucket(spec.date_column, name) if name in TIME_BUCKETS else spec.dimensions[name]).label(name)
+        for name in group_by
+    ]
+    # Results keep the measure's type (e.g. Money cents back to amounts);
+    # AVG would otherwise come back untyped
+    query = db.session.query(*groups, *[
+        (AGGREGATION_METRICS[name](spec.measure) if name == 'count'
+         else type_coerce(AGGREGATION_METRICS[name](spec.measure), spec.measure.type)).label(name)
+        for name in metrics
+    ]).select_from(spec.model)
+
+    joined = set()
+    for name in group_by:
+        if name in spec.joins and spec.joins[name][0] not in joined:
+            target, onclause = spec.joins[name]
+            query = query.outerjoin(target, onclause)
+            joined.add(target)
+    if groups:
+        query = query.group_by(*groups).order_by(*groups)
+
+    snapshot = None
+    if set(metrics) <= {'sum', 'count'}:
+        snapshot = next((
+            candidate for candidate in AGGREGATION_SNAPSHOTS.get(source, [])
+            if all(name in candidate.dimensions or name in SNAPSHOT_BUCKETS for name in group_by)
+        ), None)
+    closed = closed_ranges(start_date, end_date) if snapshot else []
+
+    # Open date ranges are read from the source table; a report lying
+    # entirely within closed periods never touches it
+    live = _open_ranges(start_date, end_date, closed)
+    bounded = [_date_range(spec.date_column, first, last) for first, last in live if first or last]
+    if bounded:
+        query = query.filter(or_(*bounded))
+    rows = query.all() if live else []
+    if closed:
+        rows = _merge_rows(rows + _snapshot_rows(snapshot, group_by, metrics, closed), len(group_by))
+
+    return [{
+        **{name: _bucket_value(row[i]) if name in TIME_BUCKETS else row[i] for i, name in enumerate(group_by)},
+        **{name: _metric_value(name, row[len(group_by) + i]) for i, name in enumerate(metrics)}
+    } for row in rows]
+
+def donor_demographics():
+    """Donor counts by age group and by region"""
+    age_groups = {'0-25': 0, '26-40': 0, '41-60': 0, '61+': 0, 'Unknown': 0}
+    for row in aggregate('donors', ['age_group'], ['count']):
+        age_groups[row['age_group']] += row['count']
+    
+    regions = {}
+    for row in aggregate('donors', ['region'], ['count']):
+        region = row['region'] or 'Unknown'
+        regions[region] = regions.get(region, 0) + row['count']
+    
+    return {
+        'age_groups': age_groups,
+        'regions': regions,
+        'total_donors': sum(age_groups.values())
+    }
+
+def donor_totals(donor_id=None):
+    """Per-donor donation sum and count as a subquery keyed by DonorID.
+
+    Given `donor_id` (e.g. Donor.DonorID, to correlate with) it is instead
+    a select of that donor's row alone, for use as a scalar subquery; no
+    row when the donor has no donations.
+    """
+    totals = select(
+        Donation.DonorID.label('DonorID'),
+        func.coalesce(func.sum(Donation.Amount), 0).label('total_amount'),
+        func.count(Donation.DonationID).label('donation_count')
+    ).group_by(Donation.DonorID)
+    if donor_id is None:
+        return totals.subquery()
+    return totals.where(Donation.DonorID == donor_id)
+
+def top_donors(limit):
+    """Donors with a positive donation total, largest first, in one query"""
+    totals = donor_totals()
+    return db.session.query(
+        Donor, totals.c.total_amount, totals.c.donation_count
+    ).join(
+        totals, totals.c.DonorID == Donor.DonorID
+    ).filter(
+        totals.c.total_amount > 0
+    ).order_by(
+        totals.c.total_amount.desc(), Donor.DonorID
+    ).limit(limit).all()
+
+def account_balances(as_of=None, account_code=None):
+    """(AccountCode, Balance, BalanceDate) of each account as of `as_of`
+    (every entry when None), by account; BalanceDate is its latest day
+    with entries.
+
+    Each account's stored balance covers every entry. As of a date, the
+    changes after it are subtracted: the later years, the later months of
+    its year and the later days of its month, each a primary key range
+    scan of at most a year's worth of rows, however long the history.
+    """
+    balance = AccountBalance
+    day = AccountDailyBalance
+    change = AccountPeriodChange
+    amount = balance.Balance
+    latest = select(func.max(day.BalanceDate)).where(day.AccountCode == balance.AccountCode)
+    if as_of:
+        latest = latest.where(day.BalanceDate <= as_of)
+        next_year = as_of.replace(year=as_of.year + 1, month=1, day=1)
+        for later in (
+            select(func.sum(change.Amount)).where(
+                change.AccountCode == balance.AccountCode, change.Period == 'year', change.PeriodStart > as_of
+            ),
+            select(func.sum(change.Amount)).where(
+                change.AccountCode == balance.AccountCode, change.Period == 'month',
+                change.PeriodStart > as_of, change.PeriodStart < next_year
+            ),
+            select(func.sum(day.DayAmount)).where(
+                day.AccountCode == balance.AccountCode, day.BalanceDate > as_of, day.BalanceDate < next_month(as_of)
+            ),
+        ):
+            amount = amount - func.coalesce(scalar(later), 0)
+
+    rows = db.session.query(
+        balance.AccountCode, type_coerce(amount, Money).label('balance'), scalar(latest).label('balance_date')
+    )
+    if account_code is not None:
+        rows = rows.filter(balance.AccountCode == (account_code or UNASSIGNED_ACCOUNT))
+    rows = rows.subquery()
+    # Accounts whose entries all come after as_of have no balance yet
+    return db.session.query(rows.c.AccountCode, rows.c.balance, rows.c.balance_date).filter(
+        rows.c.balance_date.isnot(None)
+    ).order_by(rows.c.AccountCode).all()
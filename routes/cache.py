@@ -0,0 +1,308 @@
+from flask import request, make_response, current_app, g
+from functools import wraps
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.dialects import postgresql, sqlite, mysql
+from models import db, TableVersion
+from database import RoutingSession
+from .utils import utc_today
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+class LRUCache:
+    """In-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (value, time.time() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+class SQLiteCache:
+    """Cache stored in a SQLite file, shared by every worker on the host"""
+
+    def __init__(self, path, max_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS response_cache '
+                         '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)')
+
+    def _connect(self):
+        # One connection per thread, and never one inherited across a fork
+        if getattr(self.local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return self.local.conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value FROM response_cache WHERE key = ? AND expires >= ?', (key, time.time())
+        ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO response_cache (key, value, expires) VALUES (?, ?, ?)',
+                             (key, pickle.dumps(value), time.time() + ttl))
+                conn.execute('DELETE FROM response_cache WHERE expires < ? OR key IN '
+                             '(SELECT key FROM response_cache ORDER BY expires DESC LIMIT -1 OFFSET ?)',
+                             (time.time(), self.max_entries))
+        except sqlite3.OperationalError:
+            # Another worker holds the write lock; skipping one store is harmless
+            pass
+
+class ResponseCache:
+    """Holds the configured backend and process-local hit/miss counters"""
+
+    def __init__(self):
+        self.backend = None
+        self.ttl = 300
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def configure(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__ if self.backend else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0
+            }
+
+response_cache = ResponseCache()
+
+def configure_response_cache(app):
+    """Select the cache backend from RESPONSE_CACHE (lru, sqlite or none)"""
+    kind = os.getenv('RESPONSE_CACHE', 'lru').lower()
+    ttl = int(os.getenv('RESPONSE_CACHE_TTL', 300))
+    size = int(os.getenv('RESPONSE_CACHE_SIZE', 256))
+
+    if kind == 'lru':
+        backend = LRUCache(size)
+    elif kind == 'sqlite':
+        path = os.getenv('RESPONSE_CACHE_PATH', os.path.join(app.instance_path, 'response_cache.db'))
+        backend = SQLiteCache(path, size)
+    elif kind == 'none':
+        backend = None
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE '{kind}'. Use lru, sqlite or none")
+
+    response_cache.configure(backend, ttl)
+
+    # ORM writes bump versions automatically; bulk/Core writes call
+    # bump_table_versions themselves
+    for name, hook in (('after_flush', collect_flushed_tables),
+                       ('before_commit', bump_committed_table_versions),
+                       ('after_transaction_end', forget_flushed_tables)):
+        if not event.contains(RoutingSession, name, hook):
+            event.listen(RoutingSession, name, hook)
+
+def ensure_table_versions(connection):
+    """Create the change counter table on databases that predate it; every
+    write bumps it and every cached or ETagged GET reads it"""
+    TableVersion.__table__.create(connection, checkfirst=True)
+
+def table_versions(tables):
+    """Current change counters for `tables`; tables never written report 0.
+    None when the counter table cannot be read, so callers skip caching."""
+    try:
+        rows = db.session.query(TableVersion.TableName, TableVersion.Version).filter(
+            TableVersion.TableName.in_(tables)
+        ).all()
+    except (OperationalError, ProgrammingError):
+        db.session.rollback()
+        return None
+    versions = dict(rows)
+    return tuple(versions.get(table, 0) for table in tables)
+
+def bump_table_versions(tables, connection=None):
+    """Increment the change counters of `tables`, creating missing rows.
+
+    PostgreSQL, MySQL and SQLite do it in one upsert, so two transactions
+    writing a table for the first time cannot both INSERT its row (and the
+    later commit fail on the primary key); other databases UPDATE, then
+    INSERT when no row matched.
+    """
+    connection = connection or db.session.connection()
+    version_table = TableVersion.__table__
+    rows = [{'TableName': table, 'Version': 1} for table in sorted(set(tables))]
+    if not rows:
+        return
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        upsert = (postgresql if dialect == 'postgresql' else sqlite).insert(version_table).values(rows)
+        connection.execute(upsert.on_conflict_do_update(
+            index_elements=[version_table.c.TableName], set_={'Version': version_table.c.Version + 1}
+        ))
+        return
+    if dialect == 'mysql':
+        upsert = mysql.insert(version_table).values(rows)
+        connection.execute(upsert.on_duplicate_key_update(Version=version_table.c.Version + 1))
+        return
+    for table in sorted(set(tables)):
+        updated = connection.execute(
+            version_table.update().where(version_table.c.TableName == table).values(
+                Version=version_table.c.Version + 1
+            )
+        )
+        if not updated.rowcount:
+            connection.execute(version_table.insert().values(TableName=table, Version=1))
+
+def collect_flushed_tables(session, flush_context):
+    """after_flush hook: remember the tables the flush touched"""
+    session.info.setdefault('flushed_tables', set()).update(
+        obj.__table__.name for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if obj.__table__.name != TableVersion.__tablename__
+    )
+
+def bump_committed_table_versions(session):
+    """before_commit hook: bump each table flushed in the transaction once.
+
+    Bumping on every flush updated the shared counter rows, and held their
+    row locks, from the first flush of a transaction until its commit; now
+    the counters are written, once per table, just before the commit.
+    """
+    # Commit runs its own final flush only after this hook
+    session.flush()
+    tables = session.info.pop('flushed_tables', None)
+    if tables:
+        bump_table_versions(tables, session.connection())
+
+def forget_flushed_tables(session, transaction):
+    """after_transaction_end hook: drop tables left by a rolled back transaction"""
+    if transaction.parent is None:
+        session.info.pop('flushed_tables', None)
+
+def cached(*tables):
+    """Cache a GET view's response, keyed by path, query args and the
+    change versions of the tables it reads.
+
+    Any write to one of `tables` bumps its version and so changes the key;
+    stale entries are never served and simply age out of the backend.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            backend = response_cache.backend
+            versions = table_versions(tables) if backend is not None else None
+            if versions is None:
+                return f(*args, **kwargs)
+
+            key = '%s?%s|%s' % (
+                request.path,
+                '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True))),
+                ','.join(map(str, versions))
+            )
+            entry = backend.get(key)
+            if entry is not None:
+                response_cache.count(hit=True)
+                body, status, mimetype = entry
+                return current_app.response_class(body, status=status, mimetype=mimetype)
+
+            response_cache.count(hit=False)
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                backend.set(key, (response.get_data(), response.status_code, response.mimetype),
+                            response_cache.ttl)
+            return response
+        return decorated_function
+    return decorator
+
+def cached_value(key, tables, compute):
+    """Return compute(), memoized in the response cache under `key` and the
+    change versions of `tables` (the non-view counterpart of cached())"""
+    backend = response_cache.backend
+    versions = table_versions(tables) if backend is not None else None
+    if versions is None:
+        return compute()
+
+    key = '%s|%s' % (key, ','.join(map(str, versions)))
+    value = backend.get(key)
+    if value is not None:
+        response_cache.count(hit=True)
+        return value
+
+    response_cache.count(hit=False)
+    value = compute()
+    backend.set(key, value, response_cache.ttl)
+    return value
+
+def version_etag(tables):
+    """Strong ETag for data read from `tables`, derived from their change
+    versions rather than from the response body.
+
+    The current UTC date is mixed in because several views report windows
+    relative to it (e.g. ?days=30), so their output changes at midnight UTC
+    even without writes. None when the versions cannot be read.
+    """
+    versions = table_versions(tables)
+    if versions is None:
+        return None
+    raw = '%s|%s' % (utc_today().isoformat(), ','.join(map(str, versions)))
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+def conditional_get(blueprint, *tables):
+    """Tag every GET response in `blueprint` with an ETag over `tables` and
+    answer a matching If-None-Match with 304 before the view runs"""
+    @blueprint.before_request
+    def check_etag():
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        g.etag = version_etag(tables)
+        if g.etag and request.if_none_match.contains(g.etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(g.etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return None
+
+    @blueprint.after_request
+    def set_etag(response):
+        etag = g.pop('etag', None)
+        if etag and response.status_code == 200:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
@@ -1,161 +1,264 @@
-from flask import Blueprint, jsonify, request
-from models import db, FinancialRecord, Donation, Donor, Inventory, Staff, Expense
-from datetime import datetime, timedelta
+from flask import Blueprint, jsonify, request, current_app, g
+from models import db, FinancialRecord, Donation, Donor, Inventory, Staff, Expense, FinancialDailyRollup, DonationDailyRollup
+from datetime import timedelta
 from decimal import Decimal
-from .utils import success_response, error_response, handle_exceptions
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func
+from .utils import success_response, error_response, handle_exceptions, parse_date_arg, utc_today
+from .aggregates import overview_totals, top_donors, sum_where, donor_demographics, aggregate, INCOME_TYPES, AGGREGATION_SOURCES
+from .cache import cached, cached_value, conditional_get
+import os
+import threading
 
 dashboard_bp = Blueprint('dashboard', __name__)
+conditional_get(dashboard_bp, 'financial_record', 'donation', 'donor', 'inventory', 'staff', 'expense',
+                'financial_daily_rollup', 'donation_daily_rollup')
 
-@dashboard_bp.route('/overview', methods=['GET'])
-@handle_exceptions
-def get_dashboard_overview():
-    """Get dashboard overview statistics"""
-    # Financial summary
-    financial_records = FinancialRecord.query.all()
-    total_income = sum(Decimal(str(r.Amount)) for r in financial_records if r.TransactionType in ['Income', 'Donation'] and r.Amount)
-    total_expense = sum(Decimal(str(r.Amount)) for r in financial_records if r.TransactionType == 'Expense' and r.Amount)
-    
-    # Donations
-    donations = Donation.query.all()
-    total_donations = sum(Decimal(str(d.Amount)) for d in donations if d.Amount)
-    donation_count = len(donations)
-    
-    # Donors
-    donor_count = Donor.query.count()
+def overview_data():
+    totals = overview_totals()
+    total_income = Decimal(str(totals.total_income))
+    total_expense = Decimal(str(totals.total_expense))
     
-    # Inventory
-    inventory_items = Inventory.query.all()
-    total_inventory_value = len(inventory_items)
-    low_stock_items = [i for i in inventory_items if i.Quantity < 10]
-    
-    # Staff
-    active_staff_count = Staff.query.filter(Staff.Status == 'Active').count()
-    
-    return success_response({
+    return {
         'financial': {
             'total_income': float(total_income),
             'total_expense': float(total_expense),
             'net': float(total_income - total_expense)
         },
         'donations': {
-            'total_amount': float(total_donations),
-            'count': donation_count
+            'total_amount': float(totals.donation_total),
+            'count': totals.donation_count
         },
         'donors': {
-            'count': donor_count
+            'count': totals.donor_count
         },
         'inventory': {
-            'total_items': total_inventory_value,
-            'low_stock_count': len(low_stock_items)
+            'total_items': totals.inventory_count,
+            'low_stock_count': totals.low_stock_count
         },
         'staff': {
-            'active_count': active_staff_count
+            'active_count': totals.active_staff_count
         }
-    }, "Dashboard overview retrieved successfully")
+    }
+
+def financial_trends_data(days):
+    start_date = utc_today() - timedelta(days=days)
+    
+    rollup = FinancialDailyRollup
+    rows = db.session.query(
+        rollup.RollupDate,
+        sum_where(rollup.TotalAmount, rollup.TransactionType.in_(INCOME_TYPES)).label('income'),
+        sum_where(rollup.TotalAmount, rollup.TransactionType.notin_(INCOME_TYPES)).label('expense')
+    ).filter(
+        rollup.RollupDate >= start_date
+    ).group_by(rollup.RollupDate).having(
+        func.sum(rollup.RecordCount) > 0
+    ).order_by(rollup.RollupDate).all()
+    
+    return {
+        'trends': [{
+            'date': r.RollupDate.isoformat(),
+            'income': float(r.income),
+            'expense': float(r.expense)
+        } for r in rows]
+    }
+
+def donation_trends_data(days):
+    start_date = utc_today() - timedelta(days=days)
+    
+    rollup = DonationDailyRollup
+    rows = db.session.query(
+        rollup.RollupDate,
+        func.sum(rollup.RecordCount).label('count'),
+        func.coalesce(func.sum(rollup.TotalAmount), 0).label('amount')
+    ).filter(
+        rollup.RollupDate >= start_date
+    ).group_by(rollup.RollupDate).having(
+        func.sum(rollup.RecordCount) > 0
+    ).order_by(rollup.RollupDate).all()
+    
+    return {
+        'trends': [{
+            'date': r.RollupDate.isoformat(),
+            'count': r.count,
+            'amount': float(r.amount)
+        } for r in rows]
+    }
+
+def top_donors_data(limit):
+    return {
+        'top_donors': [{
+            'id': donor.DonorID,
+            'name': donor.Name,
+            'total_donations': float(total),
+            'donation_count': count,
+            'region': donor.Region,
+            'age': donor.Age
+        } for donor, total, count in top_donors(limit)]
+    }
+
+def expense_breakdown_data():
+    breakdown = {}
+    for row in aggregate('expenses', ['type'], ['sum']):
+        exp_type = row['type'] or 'Other'
+        breakdown[exp_type] = breakdown.get(exp_type, 0) + row['sum']
+    
+    return {
+        'breakdown': breakdown
+    }
+
+# Widgets of /bundle: name -> (compute function, its parameters with
+# defaults, tables it reads)
+DASHBOARD_WIDGETS = {
+    'overview': (overview_data, {}, ('financial_record', 'donation', 'donor', 'inventory', 'staff')),
+    'financial_trends': (financial_trends_data, {'days': 30}, ('financial_record', 'financial_daily_rollup')),
+    'donation_trends': (donation_trends_data, {'days': 30}, ('donation', 'donation_daily_rollup')),
+    'expense_breakdown': (expense_breakdown_data, {}, ('expense',)),
+    'demographics': (donor_demographics, {}, ('donor',)),
+    'top_donors': (top_donors_data, {'limit': 10}, ('donation', 'donor')),
+}
+
+_bundle_executor = None
+_bundle_executor_pid = None
+_bundle_executor_lock = threading.Lock()
+
+def bundle_executor():
+    """Thread pool computing bundle widgets, created once per (forked) process"""
+    global _bundle_executor, _bundle_executor_pid
+    with _bundle_executor_lock:
+        if _bundle_executor_pid != os.getpid():
+            _bundle_executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('DASHBOARD_BUNDLE_WORKERS', 4),
+                thread_name_prefix='dashboard-bundle'
+            )
+            _bundle_executor_pid = os.getpid()
+        return _bundle_executor
+
+def parse_bundle_args():
+    """Widgets and their parameters from ?widgets=a,b&<widget>.<param>=value"""
+    raw = request.args.get('widgets')
+    names = list(DASHBOARD_WIDGETS) if raw is None else [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in DASHBOARD_WIDGETS]
+    if unknown:
+        raise ValueError(f"Unknown widget '{', '.join(unknown)}'. Allowed: {', '.join(DASHBOARD_WIDGETS)}")
+    
+    widgets = {}
+    for name in names:
+        _, defaults, _ = DASHBOARD_WIDGETS[name]
+        params = {}
+        for param, default in defaults.items():
+            value = request.args.get(f'{name}.{param}', default)
+            try:
+                params[param] = int(value)
+            except ValueError:
+                raise ValueError(f"{name}.{param} must be an integer")
+        widgets[name] = params
+    
+    for arg in request.args:
+        name, _, param = arg.partition('.')
+        if param and (name not in widgets or param not in widgets[name]):
+            raise ValueError(f"Unknown widget parameter '{arg}'")
+    return widgets
+
+def compute_widget(app, replica, name, params):
+    """Compute one widget in its own app context, and so its own session"""
+    with app.app_context():
+        g.read_replica = replica
+        compute, _, tables = DASHBOARD_WIDGETS[name]
+        key = 'widget:%s?%s' % (name, '&'.join(f'{k}={v}' for k, v in sorted(params.items())))
+        return cached_value(key, tables, lambda: compute(**params))
+
+@dashboard_bp.route('/overview', methods=['GET'])
+@handle_exceptions
+@cached('financial_record', 'donation', 'donor', 'inventory', 'staff')
+def get_dashboard_overview():
+    """Get dashboard overview statistics"""
+    return success_response(overview_data(), "Dashboard overview retrieved successfully")
 
 @dashboard_bp.route('/financial-trends', methods=['GET'])
 @handle_exceptions
+@cached('financial_record', 'financial_daily_rollup')
 def get_financial_trends():
     """Get financial trends over time"""
     days = int(request.args.get('days', 30))
-    start_date = datetime.utcnow().date() - timedelta(days=days)
-    
-    records = FinancialRecord.query.filter(
-        FinancialRecord.TransactionDate >= start_date
-    ).order_by(FinancialRecord.TransactionDate).all()
-    
-    # Group by date and type
-    trends = {}
-    for record in records:
-        date_str = record.TransactionDate.isoformat() if record.TransactionDate else None
-        if not date_str:
-            continue
-        
-        if date_str not in trends:
-            trends[date_str] = {'income': 0, 'expense': 0}
-        
-        amount = float(record.Amount) if record.Amount else 0
-        if record.TransactionType in ['Income', 'Donation']:
-            trends[date_str]['income'] += amount
-        else:
-            trends[date_str]['expense'] += amount
     
-    return success_response({
-        'trends': [{'date': k, **v} for k, v in sorted(trends.items())]
-    }, "Financial trends retrieved successfully")
+    return success_response(financial_trends_data(days), "Financial trends retrieved successfully")
 
 @dashboard_bp.route('/donation-trends', methods=['GET'])
 @handle_exceptions
+@cached('donation', 'donation_daily_rollup')
 def get_donation_trends():
     """Get donation trends over time"""
     days = int(request.args.get('days', 30))
-    start_date = datetime.utcnow().date() - timedelta(days=days)
-    
-    donations = Donation.query.filter(
-        Donation.DonationDate >= start_date
-    ).order_by(Donation.DonationDate).all()
-    
-    trends = {}
-    for donation in donations:
-        date_str = donation.DonationDate.isoformat() if donation.DonationDate else None
-        if not date_str:
-            continue
-        
-        if date_str not in trends:
-            trends[date_str] = {'count': 0, 'amount': 0}
-        
-        trends[date_str]['count'] += 1
-        trends[date_str]['amount'] += float(donation.Amount) if donation.Amount else 0
     
-    return success_response({
-        'trends': [{'date': k, **v} for k, v in sorted(trends.items())]
-    }, "Donation trends retrieved successfully")
+    return success_response(donation_trends_data(days), "Donation trends retrieved successfully")
 
 @dashboard_bp.route('/top-donors', methods=['GET'])
 @handle_exceptions
+@cached('donation', 'donor')
 def get_top_donors():
     """Get top donors by donation amount"""
     limit = int(request.args.get('limit', 10))
     
-    donors = Donor.query.all()
-    donor_stats = []
-    
-    for donor in donors:
-        total = sum(float(d.Amount) if d.Amount else 0 for d in donor.donations)
-        count = len(donor.donations)
-        if total > 0:
-            donor_stats.append({
-                'id': donor.DonorID,
-                'name': donor.Name,
-                'total_donations': total,
-                'donation_count': count,
-                'region': donor.Region,
-                'age': donor.Age
-            })
-    
-    donor_stats.sort(key=lambda x: x['total_donations'], reverse=True)
-    
-    return success_response({
-        'top_donors': donor_stats[:limit]
-    }, "Top donors retrieved successfully")
+    return success_response(top_donors_data(limit), "Top donors retrieved successfully")
 
 @dashboard_bp.route('/expense-breakdown', methods=['GET'])
 @handle_exceptions
+@cached('expense')
 def get_expense_breakdown():
     """Get expense breakdown by type"""
-    expenses = Expense.query.all()
+    return success_response(expense_breakdown_data(), "Expense breakdown retrieved successfully")
+
+@dashboard_bp.route('/bundle', methods=['GET'])
+@handle_exceptions
+def get_dashboard_bundle():
+    """Get several dashboard widgets in one response.
     
-    breakdown = {}
-    for expense in expenses:
-        exp_type = expense.Type or 'Other'
-        amount = float(expense.Amount) if expense.Amount else 0
-        
-        if exp_type not in breakdown:
-            breakdown[exp_type] = 0
-        
-        breakdown[exp_type] += amount
+    ?widgets=overview,top_donors picks the widgets (all by default) and
+    <widget>.<param> sets their parameters, e.g. top_donors.limit=5 or
+    financial_trends.days=90. The widgets are computed concurrently on a
+    small thread pool, each with its own session, and are cached
+    individually like the single-widget endpoints. Their queries run outside the
+    request, so its Server-Timing header does not count them.
+    """
+    widgets = parse_bundle_args()
+    app = current_app._get_current_object()
+    replica = g.get('read_replica')
+    
+    futures = {
+        name: bundle_executor().submit(compute_widget, app, replica, name, params)
+        for name, params in widgets.items()
+    }
     
     return success_response({
-        'breakdown': breakdown
-    }, "Expense breakdown retrieved successfully")
+        name: future.result() for name, future in futures.items()
+    }, "Dashboard bundle retrieved successfully")
+
+@dashboard_bp.route('/aggregate', methods=['GET'])
+@handle_exceptions
+def get_aggregate():
+    """Group a table by whitelisted dimensions, entirely in SQL.
 
+    ?source=ledger|expenses|donations|donors picks the table, ?group_by=
+    its dimensions and/or a time bucket (day, week, month, quarter, year),
+    ?metrics= any of sum, count, avg, min, max (default: sum,count), and
+    start_date/end_date filter on the source's date column.
+    """
+    source = request.args.get('source')
+    if not source:
+        raise ValueError(f"source is required. Allowed: {', '.join(AGGREGATION_SOURCES)}")
+    group_by = [name.strip() for name in request.args.get('group_by', '').split(',') if name.strip()]
+    metrics = [name.strip() for name in request.args.get('metrics', 'sum,count').split(',') if name.strip()]
+    start_date = parse_date_arg('start_date')
+    end_date = parse_date_arg('end_date')
+    
+    key = 'aggregate:%s?%s' % (source, '&'.join(f'{k}={v}' for k, v in sorted(request.args.items())))
+    tables = AGGREGATION_SOURCES[source].tables if source in AGGREGATION_SOURCES else ()
+    rows = cached_value(key, tables, lambda: aggregate(source, group_by, metrics, start_date, end_date))
+    
+    return success_response({
+        'source': source,
+        'group_by': group_by,
+        'metrics': metrics,
+        'rows': rows
+    }, "Aggregate retrieved successfully")
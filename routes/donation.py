@@ -1,37 +1,80 @@
 from flask import Blueprint, request, jsonify
-from models import db, Donation, Donor, Gift, FinancialRecord, DonationFinancialRecord
+from models import db, Donation, Donor, Gift, Staff, FinancialRecord, DonationFinancialRecord
 from datetime import datetime
 from decimal import Decimal
-from .utils import success_response, error_response, handle_exceptions, validate_json
+from .utils import success_response, error_response, handle_exceptions, validate_json, keyset_page, stream_response, parse_date_arg, json_response, parse_fields_arg
+from .export import export_response
+from .rollups import track_financial_record, track_donation, track_financial_rows, track_donation_rows
+from .periods import reject_closed_periods
+from .imports import read_import_rows, bulk_import, import_response, reject_missing, reserve_ids, parse_date, parse_decimal, parse_int
+from .aggregates import donor_demographics
+from .cache import cached, conditional_get
+from .serializers import DONATION, DONOR, GIFT
 
 donation_bp = Blueprint('donation', __name__)
+conditional_get(donation_bp, 'donation', 'donor', 'gift', 'staff', 'financial_record',
+                'donation_financial_record')
 
 @donation_bp.route('/donations', methods=['GET'])
+@handle_exceptions
 def get_donations():
     """Get all donations"""
     status = request.args.get('status')
     donor_id = request.args.get('donor_id')
     
-    query = Donation.query
+    projection = DONATION.only(parse_fields_arg(DONATION.names), Donation.DonationDate, Donation.DonationID)
+    query = projection.query()
     
     if status:
         query = query.filter(Donation.Status == status)
     if donor_id:
         query = query.filter(Donation.DonorID == int(donor_id))
     
-    donations = query.order_by(Donation.DonationDate.desc()).all()
-    
-    return jsonify([{
-        'id': d.DonationID,
-        'type': d.DonationType,
-        'status': d.Status,
-        'amount': float(d.Amount) if d.Amount else 0,
-        'date': d.DonationDate.isoformat() if d.DonationDate else None,
-        'donor_id': d.DonorID,
-        'donor_name': d.donor.Name if d.donor else None,
-        'staff_id': d.StaffID,
-        'gift_id': d.GiftID
-    } for d in donations])
+    page = keyset_page(query, Donation.DonationDate, Donation.DonationID)
+    if not page:
+        return stream_response(query.order_by(Donation.DonationDate.desc()), projection.serialize)
+    
+    data = projection.serialize_all(page.items)
+    
+    return success_response(data, "Donations retrieved successfully", page=page)
+
+@donation_bp.route('/donations/export', methods=['GET'])
+@handle_exceptions
+def export_donations():
+    """Export donations as a CSV or JSON Lines download"""
+    donation_type = request.args.get('type')
+    status = request.args.get('status')
+    donor_id = request.args.get('donor_id')
+    start_date = parse_date_arg('start_date')
+    end_date = parse_date_arg('end_date')
+    
+    query = db.session.query(
+        Donation.DonationID,
+        Donation.DonationDate,
+        Donation.DonationType,
+        Donation.Status,
+        Donation.Amount,
+        Donation.DonorID,
+        Donor.Name,
+        Donation.StaffID,
+        Donation.GiftID
+    ).outerjoin(Donor, Donor.DonorID == Donation.DonorID)
+    
+    if donation_type:
+        query = query.filter(Donation.DonationType == donation_type)
+    if status:
+        query = query.filter(Donation.Status == status)
+    if donor_id:
+        query = query.filter(Donation.DonorID == int(donor_id))
+    if start_date:
+        query = query.filter(Donation.DonationDate >= start_date)
+    if end_date:
+        query = query.filter(Donation.DonationDate <= end_date)
+    
+    query = query.order_by(Donation.DonationDate, Donation.DonationID)
+    
+    return export_response(query, ['id', 'date', 'type', 'status', 'amount', 'donor_id',
+                                   'donor_name', 'staff_id', 'gift_id'], 'donations')
 
 @donation_bp.route('/donations', methods=['POST'])
 @validate_json
@@ -53,6 +96,7 @@ def create_donation():
         
         db.session.add(donation)
         db.session.flush()
+        track_donation(donation)
         
         # Create financial record for monetary donations
         if donation.DonationType == 'Monetary' and donation.Amount:
@@ -64,6 +108,7 @@ def create_donation():
             )
             db.session.add(financial_record)
             db.session.flush()
+            track_financial_record(financial_record)
             
             donation_financial = DonationFinancialRecord(
                 DonationID=donation.DonationID,
@@ -82,6 +127,70 @@ def create_donation():
     except ValueError as e:
         return error_response(f"Invalid date format: {str(e)}", 400)
 
+def validate_donation_row(row):
+    """Map one bulk import row onto Donation columns"""
+    donor_id = parse_int(row.get('donor_id'), 'donor_id')
+    if donor_id is None:
+        raise ValueError("donor_id is required")
+    
+    return {
+        'DonationType': row.get('type', 'Monetary'),
+        'Status': row.get('status', 'Pending'),
+        'Amount': parse_decimal(row.get('amount', 0), 'amount'),
+        'DonationDate': parse_date(row.get('date'), 'date') or datetime.utcnow().date(),
+        'DonorID': donor_id,
+        'StaffID': parse_int(row.get('staff_id'), 'staff_id'),
+        'GiftID': parse_int(row.get('gift_id'), 'gift_id')
+    }
+
+def insert_donations(chunk):
+    """Bulk insert one chunk of donations plus the ledger rows create_donation adds"""
+    chunk, rejected = reject_missing(chunk, 'DonorID', Donor.DonorID, 'Donor')
+    chunk, rejected_staff = reject_missing(chunk, 'StaffID', Staff.StaffID, 'Staff')
+    chunk, rejected_gifts = reject_missing(chunk, 'GiftID', Gift.GiftID, 'Gift')
+    chunk, rejected_closed = reject_closed_periods(
+        chunk, 'DonationDate', lambda m: m['DonationType'] == 'Monetary' and m['Amount']
+    )
+    rejected += rejected_staff + rejected_gifts + rejected_closed
+    
+    mappings = [mapping for _, mapping in chunk]
+    monetary = [m for m in mappings if m['DonationType'] == 'Monetary' and m['Amount']]
+    other = [m for m in mappings if not (m['DonationType'] == 'Monetary' and m['Amount'])]
+    
+    # Keys of donations that get a ledger row, and of those rows, are
+    # reserved up front so every table is written with one executemany
+    db.session.bulk_insert_mappings(Donation, other)
+    for m, donation_id in zip(monetary, reserve_ids(Donation.DonationID, len(monetary))):
+        m['DonationID'] = donation_id
+    db.session.bulk_insert_mappings(Donation, monetary)
+    
+    records = [{
+        'FinancialRecordID': record_id,
+        'TransactionDate': m['DonationDate'],
+        'TransactionType': 'Donation',
+        'AccountCode': None,
+        'Amount': m['Amount'],
+        'Description': f"Donation from donor {m['DonorID']}"
+    } for m, record_id in zip(monetary, reserve_ids(FinancialRecord.FinancialRecordID, len(monetary)))]
+    db.session.bulk_insert_mappings(FinancialRecord, records)
+    db.session.bulk_insert_mappings(DonationFinancialRecord, [{
+        'DonationID': m['DonationID'],
+        'FinancialRecordID': r['FinancialRecordID']
+    } for m, r in zip(monetary, records)])
+    
+    track_donation_rows(mappings)
+    track_financial_rows(records)
+    return rejected
+
+@donation_bp.route('/donations/bulk', methods=['POST'])
+@handle_exceptions
+def bulk_create_donations():
+    """Create donations from a JSON array or an uploaded CSV/JSONL file"""
+    result = bulk_import(read_import_rows(), validate_donation_row, insert_donations,
+                         ['donation', 'financial_record', 'donation_financial_record',
+                          'donation_daily_rollup', 'financial_daily_rollup'])
+    return import_response(result, "donations")
+
 @donation_bp.route('/donations/<int:donation_id>', methods=['GET'])
 @handle_exceptions
 def get_donation(donation_id):
@@ -107,6 +216,8 @@ def update_donation(donation_id):
     donation = Donation.query.get_or_404(donation_id)
     data = request.json
     
+    track_donation(donation, sign=-1)
+    
     if 'type' in data:
         donation.DonationType = data['type']
     if 'status' in data:
@@ -123,6 +234,7 @@ def update_donation(donation_id):
     if 'staff_id' in data:
         donation.StaffID = data['staff_id']
     
+    track_donation(donation)
     db.session.commit()
     
     return success_response({
@@ -133,26 +245,25 @@ def update_donation(donation_id):
     }, "Donation updated successfully")
 
 @donation_bp.route('/donors', methods=['GET'])
+@handle_exceptions
 def get_donors():
     """Get all donors"""
     region = request.args.get('region')
     
-    query = Donor.query
+    projection = DONOR.only(parse_fields_arg(DONOR.names), Donor.RegistrationDate, Donor.DonorID)
+    query = projection.query()
     
     if region:
         query = query.filter(Donor.Region == region)
     
-    donors = query.order_by(Donor.RegistrationDate.desc()).all()
-    
-    return jsonify([{
-        'id': d.DonorID,
-        'name': d.Name,
-        'contact_info': d.ContactInfo,
-        'registration_date': d.RegistrationDate.isoformat() if d.RegistrationDate else None,
-        'age': d.Age,
-        'region': d.Region,
-        'total_donations': sum(float(don.Amount) if don.Amount else 0 for don in d.donations)
-    } for d in donors])
+    page = keyset_page(query, Donor.RegistrationDate, Donor.DonorID)
+    donors = page.items if page else query.order_by(Donor.RegistrationDate.desc()).all()
+    
+    data = projection.serialize_all(donors)
+    
+    if page:
+        return success_response(data, "Donors retrieved successfully", page=page)
+    return json_response(data)
 
 @donation_bp.route('/donors', methods=['POST'])
 @validate_json
@@ -182,6 +293,31 @@ def create_donor():
     except ValueError as e:
         return error_response(f"Invalid date format: {str(e)}", 400)
 
+def validate_donor_row(row):
+    """Map one bulk import row onto Donor columns"""
+    if not row.get('name'):
+        raise ValueError("Name is required")
+    
+    return {
+        'Name': row['name'],
+        'ContactInfo': row.get('contact_info'),
+        'RegistrationDate': parse_date(row.get('registration_date'), 'registration_date') or datetime.utcnow().date(),
+        'Age': parse_int(row.get('age'), 'age'),
+        'Region': row.get('region')
+    }
+
+def insert_donors(chunk):
+    """Bulk insert one chunk of validated donor rows"""
+    db.session.bulk_insert_mappings(Donor, [mapping for _, mapping in chunk])
+    return []
+
+@donation_bp.route('/donors/bulk', methods=['POST'])
+@handle_exceptions
+def bulk_create_donors():
+    """Create donors from a JSON array or an uploaded CSV/JSONL file"""
+    result = bulk_import(read_import_rows(), validate_donor_row, insert_donors, ['donor'])
+    return import_response(result, "donors")
+
 @donation_bp.route('/donors/<int:donor_id>', methods=['GET'])
 @handle_exceptions
 def get_donor(donor_id):
@@ -229,51 +365,19 @@ def update_donor(donor_id):
     }, "Donor updated successfully")
 
 @donation_bp.route('/demographics', methods=['GET'])
+@cached('donor')
 def get_donor_demographics():
     """Get donor demographics statistics"""
-    donors = Donor.query.all()
-    
-    # Age groups
-    age_groups = {'0-25': 0, '26-40': 0, '41-60': 0, '61+': 0, 'Unknown': 0}
-    
-    # Regions
-    regions = {}
-    
-    for donor in donors:
-        # Age grouping
-        if donor.Age:
-            if donor.Age <= 25:
-                age_groups['0-25'] += 1
-            elif donor.Age <= 40:
-                age_groups['26-40'] += 1
-            elif donor.Age <= 60:
-                age_groups['41-60'] += 1
-            else:
-                age_groups['61+'] += 1
-        else:
-            age_groups['Unknown'] += 1
-        
-        # Region grouping
-        region = donor.Region or 'Unknown'
-        regions[region] = regions.get(region, 0) + 1
-    
-    return jsonify({
-        'age_groups': age_groups,
-        'regions': regions,
-        'total_donors': len(donors)
-    })
+    return jsonify(donor_demographics())
 
 @donation_bp.route('/gifts', methods=['GET'])
+@handle_exceptions
 def get_gifts():
     """Get all gifts"""
-    gifts = Gift.query.all()
-    
-    return jsonify([{
-        'id': g.GiftID,
-        'type': g.GiftType,
-        'quantity': g.Quantity,
-        'distribution_date': g.DistributionDate.isoformat() if g.DistributionDate else None
-    } for g in gifts])
+    projection = GIFT.only(parse_fields_arg(GIFT.names))
+    gifts = projection.query().all()
+    
+    return json_response(projection.serialize_all(gifts))
 
 @donation_bp.route('/gifts', methods=['POST'])
 def create_gift():
@@ -0,0 +1,91 @@
+from flask import request, Response, stream_with_context
+from datetime import date, datetime
+from decimal import Decimal
+import csv
+import io
+import json
+import zlib
+
+# Rows fetched from the server-side cursor per chunk
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson'
+}
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def _csv_batches(rows, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    count = 0
+    for row in rows:
+        writer.writerow([_csv_value(v) for v in row])
+        count += 1
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _jsonl_batches(rows, fields):
+    batch = []
+    for row in rows:
+        batch.append(json.dumps({f: _json_value(v) for f, v in zip(fields, row)}) + '\n')
+        if len(batch) == EXPORT_BATCH_SIZE:
+            yield ''.join(batch)
+            batch = []
+    yield ''.join(batch)
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_response(query, fields, filename):
+    """Stream a column query as a CSV or JSON Lines download.
+
+    `query` must select plain columns in the same order as `fields`. Rows
+    come from a server-side cursor EXPORT_BATCH_SIZE at a time, and the
+    output is optionally gzip-compressed as it is produced, so memory use
+    does not grow with the size of the export. The format comes from
+    ?format=csv|jsonl and compression from ?gzip=true.
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{export_format}'. Use csv or jsonl")
+    compress = request.args.get('gzip', 'false').lower() in ('1', 'true', 'yes')
+    
+    rows = query.yield_per(EXPORT_BATCH_SIZE)
+    if export_format == 'csv':
+        chunks = _csv_batches(rows, fields)
+    else:
+        chunks = _jsonl_batches(rows, fields)
+    
+    filename = f"{filename}.{export_format}"
+    mimetype = EXPORT_FORMATS[export_format]
+    if compress:
+        chunks = _gzipped(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
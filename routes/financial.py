@@ -1,10 +1,20 @@
 from flask import Blueprint, request, jsonify
-from models import db, FinancialRecord, PurchaseOrder, PayrollRecord, Expense, PurchaseOrderFinancialRecord, PayrollFinancialRecord
+from models import db, FinancialRecord, PurchaseOrder, PayrollRecord, Expense, PurchaseOrderFinancialRecord, PayrollFinancialRecord, FinancialPeriod
 from datetime import datetime
 from decimal import Decimal
-from .utils import success_response, error_response, handle_exceptions, validate_json
+from .utils import success_response, error_response, handle_exceptions, validate_json, keyset_page, stream_response, parse_date_arg, json_response, parse_fields_arg
+from .export import export_response
+from .rollups import track_financial_record, track_financial_rows
+from .periods import parse_period, period_dict, close_period, reopen_period, reject_closed_periods
+from .imports import read_import_rows, bulk_import, import_response, parse_date, parse_decimal
+from .aggregates import aggregate, account_balances, INCOME_TYPES
+from .cache import conditional_get
+from .serializers import FINANCIAL_RECORD, EXPENSE
 
 financial_bp = Blueprint('financial', __name__)
+conditional_get(financial_bp, 'financial_record', 'purchase_order', 'payroll_record', 'expense',
+                'purchase_order_financial_record', 'payroll_financial_record', 'financial_period',
+                'account_daily_balance', 'account_period_change', 'account_balance')
 
 @financial_bp.route('/records', methods=['GET'])
 @handle_exceptions
@@ -14,7 +24,8 @@ def get_financial_records():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    query = FinancialRecord.query
+    projection = FINANCIAL_RECORD.only(parse_fields_arg(FINANCIAL_RECORD.names), FinancialRecord.TransactionDate, FinancialRecord.FinancialRecordID)
+    query = projection.query()
     
     if transaction_type:
         query = query.filter(FinancialRecord.TransactionType == transaction_type)
@@ -29,18 +40,42 @@ def get_financial_records():
         except ValueError:
             return error_response("Invalid end_date format. Use YYYY-MM-DD", 400)
     
-    records = query.order_by(FinancialRecord.TransactionDate.desc()).all()
+    page = keyset_page(query, FinancialRecord.TransactionDate, FinancialRecord.FinancialRecordID)
+    if not page:
+        return stream_response(query.order_by(FinancialRecord.TransactionDate.desc()),
+                               projection.serialize, "Financial records retrieved successfully")
     
-    data = [{
-        'id': r.FinancialRecordID,
-        'date': r.TransactionDate.isoformat() if r.TransactionDate else None,
-        'type': r.TransactionType,
-        'amount': float(r.Amount) if r.Amount else 0,
-        'account_code': r.AccountCode,
-        'description': r.Description
-    } for r in records]
+    data = projection.serialize_all(page.items)
     
-    return success_response(data, "Financial records retrieved successfully")
+    return success_response(data, "Financial records retrieved successfully", page=page)
+
+@financial_bp.route('/records/export', methods=['GET'])
+@handle_exceptions
+def export_financial_records():
+    """Export the ledger as a CSV or JSON Lines download"""
+    transaction_type = request.args.get('type')
+    start_date = parse_date_arg('start_date')
+    end_date = parse_date_arg('end_date')
+    
+    query = db.session.query(
+        FinancialRecord.FinancialRecordID,
+        FinancialRecord.TransactionDate,
+        FinancialRecord.TransactionType,
+        FinancialRecord.AccountCode,
+        FinancialRecord.Amount,
+        FinancialRecord.Description
+    )
+    
+    if transaction_type:
+        query = query.filter(FinancialRecord.TransactionType == transaction_type)
+    if start_date:
+        query = query.filter(FinancialRecord.TransactionDate >= start_date)
+    if end_date:
+        query = query.filter(FinancialRecord.TransactionDate <= end_date)
+    
+    query = query.order_by(FinancialRecord.TransactionDate, FinancialRecord.FinancialRecordID)
+    
+    return export_response(query, ['id', 'date', 'type', 'account_code', 'amount', 'description'], 'ledger')
 
 @financial_bp.route('/records', methods=['POST'])
 @validate_json
@@ -62,6 +97,7 @@ def create_financial_record():
         )
         
         db.session.add(record)
+        track_financial_record(record)
         db.session.commit()
         
         return success_response({
@@ -73,38 +109,45 @@ def create_financial_record():
     except ValueError as e:
         return error_response(f"Invalid date format: {str(e)}", 400)
 
+def validate_financial_record_row(row):
+    """Map one bulk import row onto FinancialRecord columns"""
+    amount = parse_decimal(row.get('amount'), 'amount')
+    if not amount:
+        raise ValueError("Amount is required")
+    
+    return {
+        'TransactionDate': parse_date(row.get('date'), 'date') or datetime.utcnow().date(),
+        'TransactionType': row.get('type', 'Expense'),
+        'AccountCode': row.get('account_code'),
+        'Amount': amount,
+        'Description': row.get('description')
+    }
+
+def insert_financial_records(chunk):
+    """Bulk insert one chunk of validated financial record rows"""
+    chunk, rejected = reject_closed_periods(chunk, 'TransactionDate')
+    mappings = [mapping for _, mapping in chunk]
+    db.session.bulk_insert_mappings(FinancialRecord, mappings)
+    track_financial_rows(mappings)
+    return rejected
+
+@financial_bp.route('/records/bulk', methods=['POST'])
+@handle_exceptions
+def bulk_create_financial_records():
+    """Create financial records from a JSON array or an uploaded CSV/JSONL file"""
+    result = bulk_import(read_import_rows(), validate_financial_record_row, insert_financial_records,
+                         ['financial_record', 'financial_daily_rollup'])
+    return import_response(result, "financial records")
+
 @financial_bp.route('/summary', methods=['GET'])
+@handle_exceptions
 def get_financial_summary():
     """Get financial summary by type"""
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    
-    query = FinancialRecord.query
-    
-    if start_date:
-        query = query.filter(FinancialRecord.TransactionDate >= datetime.strptime(start_date, '%Y-%m-%d').date())
-    if end_date:
-        query = query.filter(FinancialRecord.TransactionDate <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    rows = aggregate('ledger', ['type'], ['sum'], parse_date_arg('start_date'), parse_date_arg('end_date'))
     
-    records = query.all()
-    
-    summary = {}
-    total_income = Decimal('0')
-    total_expense = Decimal('0')
-    
-    for record in records:
-        amount = Decimal(str(record.Amount)) if record.Amount else Decimal('0')
-        trans_type = record.TransactionType
-        
-        if trans_type not in summary:
-            summary[trans_type] = Decimal('0')
-        
-        summary[trans_type] += amount
-        
-        if trans_type in ['Income', 'Donation']:
-            total_income += amount
-        else:
-            total_expense += amount
+    summary = {row['type']: Decimal(str(row['sum'])) for row in rows}
+    total_income = sum((amount for t, amount in summary.items() if t in INCOME_TYPES), Decimal('0'))
+    total_expense = sum((amount for t, amount in summary.items() if t not in INCOME_TYPES), Decimal('0'))
     
     return jsonify({
         'by_type': {k: float(v) for k, v in summary.items()},
@@ -113,19 +156,68 @@ def get_financial_summary():
         'net': float(total_income - total_expense)
     })
 
+@financial_bp.route('/balances', methods=['GET'])
+@handle_exceptions
+def get_account_balances():
+    """Get the balance of every account, or of ?account_code=, as of ?as_of=
+    (default: including every entry). Income types add to a balance and
+    all other types subtract; entries without an account are reported
+    under a null account_code."""
+    as_of = parse_date_arg('as_of')
+    rows = account_balances(as_of, request.args.get('account_code'))
+    
+    return success_response({
+        'as_of': as_of.isoformat() if as_of else None,
+        'balances': [{
+            'account_code': account_code or None,
+            'balance': float(balance),
+            'last_entry_date': day.isoformat()
+        } for account_code, balance, day in rows],
+        'total': float(sum((balance for _, balance, _ in rows), Decimal('0')))
+    }, "Account balances retrieved successfully")
+
+@financial_bp.route('/periods', methods=['GET'])
+@handle_exceptions
+def get_closed_periods():
+    """List the closed accounting periods"""
+    periods = FinancialPeriod.query.order_by(FinancialPeriod.PeriodStart).all()
+    
+    return success_response([period_dict(p) for p in periods], "Closed periods retrieved successfully")
+
+@financial_bp.route('/periods', methods=['POST'])
+@validate_json
+@handle_exceptions
+def close_financial_period():
+    """Close a month (2024-03), quarter (2024-Q1) or year (2024).
+    
+    Its ledger totals are frozen for reports, and ledger rows dated in it
+    can no longer be created, changed or deleted until it is reopened.
+    """
+    period = close_period(request.json.get('period'))
+    
+    return success_response(period_dict(period), f"Period {period.Period} closed successfully", 201)
+
+@financial_bp.route('/periods/<label>', methods=['DELETE'])
+@handle_exceptions
+def reopen_financial_period(label):
+    """Reopen a closed period so its ledger rows can be corrected"""
+    label, _, _ = parse_period(label)
+    period = FinancialPeriod.query.filter_by(Period=label).first()
+    if period is None:
+        return error_response(f"Period {label} is not closed", 404)
+    
+    reopen_period(period)
+    
+    return success_response(period_dict(period), f"Period {label} reopened successfully")
+
 @financial_bp.route('/expenses', methods=['GET'])
+@handle_exceptions
 def get_expenses():
     """Get all expenses"""
-    expenses = Expense.query.order_by(Expense.Date.desc()).all()
+    projection = EXPENSE.only(parse_fields_arg(EXPENSE.names))
+    expenses = projection.query().order_by(Expense.Date.desc()).all()
     
-    return jsonify([{
-        'id': e.ExpenseID,
-        'date': e.Date.isoformat() if e.Date else None,
-        'type': e.Type,
-        'amount': float(e.Amount) if e.Amount else 0,
-        'description': e.Description,
-        'staff_id': e.StaffID
-    } for e in expenses])
+    return json_response(projection.serialize_all(expenses))
 
 @financial_bp.route('/records/<int:record_id>', methods=['GET'])
 @handle_exceptions
@@ -150,6 +242,8 @@ def update_financial_record(record_id):
     record = FinancialRecord.query.get_or_404(record_id)
     data = request.json
     
+    track_financial_record(record, sign=-1)
+    
     if 'date' in data:
         try:
             record.TransactionDate = datetime.strptime(data['date'], '%Y-%m-%d').date()
@@ -164,6 +258,7 @@ def update_financial_record(record_id):
     if 'description' in data:
         record.Description = data['description']
     
+    track_financial_record(record)
     db.session.commit()
     
     return success_response({
@@ -0,0 +1,195 @@
+from flask import request
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from models import db
+from .utils import success_response, error_response
+from .cache import bump_table_versions
+import csv
+import io
+import json
+
+# Rows validated and inserted per transaction. Also bounds the IN (...)
+# lists used for reference checks, so keep it below SQLite's variable limit.
+IMPORT_CHUNK_SIZE = 500
+
+IMPORT_MIMETYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl'
+}
+
+def _jsonl_rows(text):
+    for line in text:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield e
+
+def read_import_rows():
+    """Iterate the rows of a bulk import request.
+
+    Accepts a JSON array body, an uploaded .csv/.jsonl file in the `file`
+    form field, or a raw text/csv or application/x-ndjson body. Files are
+    parsed lazily so only the current chunk is held in memory.
+    """
+    if request.is_json:
+        data = request.get_json()
+        if not isinstance(data, list):
+            raise ValueError("Expected a JSON array of objects")
+        return iter(data)
+    
+    if 'file' in request.files:
+        upload = request.files['file']
+        name = (upload.filename or '').lower()
+        stream = upload.stream
+        if name.endswith('.csv'):
+            import_format = 'csv'
+        elif name.endswith(('.jsonl', '.ndjson')):
+            import_format = 'jsonl'
+        else:
+            import_format = None
+    else:
+        stream = request.stream
+        import_format = IMPORT_MIMETYPES.get(request.mimetype)
+    
+    if import_format is None:
+        raise ValueError("Send a JSON array, or a .csv or .jsonl file")
+    
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if import_format == 'csv':
+        return csv.DictReader(text)
+    return _jsonl_rows(text)
+
+def parse_date(value, field):
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"Invalid {field} format. Use YYYY-MM-DD")
+
+def parse_decimal(value, field):
+    if value in (None, ''):
+        return None
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"Invalid {field}: {value}")
+    if not amount.is_finite():
+        raise ValueError(f"Invalid {field}: {value}")
+    return amount
+
+def parse_int(value, field):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {field}: {value}")
+
+def reserve_ids(column, count):
+    """`count` primary key values for new rows of `column`'s table.
+
+    Rows inserted with these keys go out as one executemany, and rows
+    referencing them can be built before the insert, instead of reading
+    generated keys back one INSERT at a time. PostgreSQL draws them from
+    the column's sequence. Elsewhere they follow MAX(key), as the database
+    would assign them, after the table is write-locked until commit: SQLite
+    takes its database write lock with an empty UPDATE, MySQL locks the
+    end of the index with SELECT ... FOR UPDATE.
+    """
+    if not count:
+        return []
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    table = column.table
+    if dialect == 'postgresql':
+        sequence = func.pg_get_serial_sequence(table.name, column.name)
+        return list(connection.execute(
+            select(func.nextval(sequence)).select_from(func.generate_series(1, count))
+        ).scalars())
+    if dialect == 'sqlite':
+        connection.execute(table.update().where(text('0')).values({column.name: column}))
+    query = select(func.coalesce(func.max(column), 0))
+    if dialect == 'mysql':
+        query = query.with_for_update()
+    first = connection.execute(query).scalar() + 1
+    return list(range(first, first + count))
+
+def reject_missing(chunk, key, column, label):
+    """Split (row_number, mapping) pairs on whether mapping[key] exists in column"""
+    ids = {mapping[key] for _, mapping in chunk if mapping.get(key) is not None}
+    found = {value for value, in db.session.query(column).filter(column.in_(ids))} if ids else set()
+    
+    kept, rejected = [], []
+    for number, mapping in chunk:
+        if mapping.get(key) is not None and mapping[key] not in found:
+            rejected.append({'row': number, 'error': f"{label} {mapping[key]} does not exist"})
+        else:
+            kept.append((number, mapping))
+    return kept, rejected
+
+def _insert_chunk(chunk, insert, tables, errors):
+    try:
+        rejected = insert(chunk)
+        bump_table_versions(tables)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        message = f"Database error: {getattr(e, 'orig', e)}"
+        errors.extend({'row': number, 'error': message} for number, _ in chunk)
+        return 0
+    errors.extend(rejected)
+    return len(chunk) - len(rejected)
+
+def bulk_import(rows, validate, insert, tables):
+    """Validate and insert rows in chunked transactions.
+
+    `validate` turns one input row into a model mapping or raises
+    ValueError; `insert` bulk-inserts a list of (row_number, mapping)
+    pairs inside the current transaction and returns error entries for
+    any rows it refused. Bulk inserts bypass the ORM flush, so the
+    versions of `tables` are bumped explicitly. Each chunk is committed
+    on its own, so a bad chunk only fails its own rows. Returns a summary
+    with per-row errors.
+    """
+    total = created = 0
+    errors = []
+    chunk = []
+    
+    for number, row in enumerate(rows, start=1):
+        total = number
+        try:
+            if isinstance(row, Exception):
+                raise ValueError(f"Malformed row: {row}")
+            if not isinstance(row, dict):
+                raise ValueError("Row must be an object")
+            chunk.append((number, validate({k: v for k, v in row.items() if v != ''})))
+        except ValueError as e:
+            errors.append({'row': number, 'error': str(e)})
+        
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            created += _insert_chunk(chunk, insert, tables, errors)
+            chunk = []
+    
+    if chunk:
+        created += _insert_chunk(chunk, insert, tables, errors)
+    
+    errors.sort(key=lambda e: e['row'])
+    return {
+        'total': total,
+        'created': created,
+        'failed': len(errors),
+        'errors': errors
+    }
+
+def import_response(result, label):
+    """Summarize a bulk import; 201 when anything was created, else 400"""
+    message = f"Imported {result['created']} of {result['total']} {label}"
+    if not result['created']:
+        return error_response(message, 400, result['errors'])
+    return success_response(result, message, 201)
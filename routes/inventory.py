@@ -1,23 +1,58 @@
 from flask import Blueprint, request, jsonify
+from sqlalchemy.orm import joinedload, selectinload, load_only
 from models import db, Inventory, DemandPlan, Supplier, PurchaseOrder, PurchaseOrderInventory, FinancialRecord, PurchaseOrderFinancialRecord
 from datetime import datetime
 from decimal import Decimal
-from .utils import success_response, error_response, handle_exceptions, validate_json
+from .utils import success_response, error_response, handle_exceptions, validate_json, keyset_page, stream_response, parse_include_arg, json_response, parse_fields_arg
+from .rollups import track_financial_record
+from .cache import conditional_get
+from .serializers import INVENTORY, DEMAND_PLAN, SUPPLIER, PURCHASE_ORDER
 
 inventory_bp = Blueprint('inventory', __name__)
+conditional_get(inventory_bp, 'inventory', 'demand_plan', 'supplier', 'purchase_order',
+                'purchase_order_inventory', 'financial_record', 'purchase_order_financial_record')
+
+# Expansions of the purchase order list, selected with ?include=
+PURCHASE_ORDER_INCLUDES = ('items', 'supplier')
+
+# Output field each expansion adds, for ?fields=
+PURCHASE_ORDER_EXPANSION_FIELDS = {'items': 'items', 'supplier': 'supplier_name'}
+
+def purchase_order_load_options(include):
+    """Eager-load profile for the expansions in `include`.
+
+    The supplier is joined into the order query; items and their inventory
+    rows come from one extra SELECT ... IN per batch of orders. Either way
+    the query count does not grow with the number of orders.
+    """
+    options = []
+    if 'supplier' in include:
+        options.append(joinedload(PurchaseOrder.supplier))
+    if 'items' in include:
+        options.append(selectinload(PurchaseOrder.inventory_items).joinedload(PurchaseOrderInventory.inventory))
+    return options
+
+def serialize_purchase_order(po, include=PURCHASE_ORDER_INCLUDES, projection=PURCHASE_ORDER):
+    """List representation of a purchase order with the expansions in `include`"""
+    data = projection.serialize_object(po)
+    if 'supplier' in include:
+        data['supplier_name'] = po.supplier.Name if po.supplier else None
+    if 'items' in include:
+        data['items'] = [{
+            'inventory_id': poi.InventoryID,
+            'item_name': poi.inventory.ItemName if poi.inventory else None,
+            'quantity': poi.Quantity
+        } for poi in po.inventory_items]
+    return data
 
 @inventory_bp.route('/items', methods=['GET'])
+@handle_exceptions
 def get_inventory_items():
     """Get all inventory items"""
-    items = Inventory.query.all()
+    projection = INVENTORY.only(parse_fields_arg(INVENTORY.names))
+    items = projection.query().all()
     
-    return jsonify([{
-        'id': i.InventoryID,
-        'item_name': i.ItemName,
-        'quantity': i.Quantity,
-        'location': i.Location,
-        'demand_plan_id': i.DemandPlanID
-    } for i in items])
+    return json_response(projection.serialize_all(items))
 
 @inventory_bp.route('/items', methods=['POST'])
 def create_inventory_item():
@@ -75,16 +110,13 @@ def update_inventory_item(item_id):
     }, "Inventory item updated successfully")
 
 @inventory_bp.route('/demand-plans', methods=['GET'])
+@handle_exceptions
 def get_demand_plans():
     """Get all demand plans"""
-    plans = DemandPlan.query.order_by(DemandPlan.PlanDate.desc()).all()
+    projection = DEMAND_PLAN.only(parse_fields_arg(DEMAND_PLAN.names))
+    plans = projection.query().order_by(DemandPlan.PlanDate.desc()).all()
     
-    return jsonify([{
-        'id': p.DemandPlanID,
-        'item_name': p.ItemName,
-        'forecast_quantity': p.ForecastQuantity,
-        'plan_date': p.PlanDate.isoformat() if p.PlanDate else None
-    } for p in plans])
+    return json_response(projection.serialize_all(plans))
 
 @inventory_bp.route('/demand-plans', methods=['POST'])
 def create_demand_plan():
@@ -103,16 +135,13 @@ def create_demand_plan():
     return jsonify({'id': plan.DemandPlanID, 'message': 'Demand plan created successfully'}), 201
 
 @inventory_bp.route('/suppliers', methods=['GET'])
+@handle_exceptions
 def get_suppliers():
     """Get all suppliers"""
-    suppliers = Supplier.query.all()
+    projection = SUPPLIER.only(parse_fields_arg(SUPPLIER.names))
+    suppliers = projection.query().all()
     
-    return jsonify([{
-        'id': s.SupplierID,
-        'name': s.Name,
-        'contact_info': s.ContactInfo,
-        'address': s.Address
-    } for s in suppliers])
+    return json_response(projection.serialize_all(suppliers))
 
 @inventory_bp.route('/suppliers', methods=['POST'])
 @validate_json
@@ -175,33 +204,32 @@ def update_supplier(supplier_id):
     }, "Supplier updated successfully")
 
 @inventory_bp.route('/purchase-orders', methods=['GET'])
+@handle_exceptions
 def get_purchase_orders():
-    """Get all purchase orders"""
+    """Get all purchase orders; ?include=items,supplier picks the expansions, ?fields= the output fields"""
     status = request.args.get('status')
+    include = parse_include_arg(PURCHASE_ORDER_INCLUDES)
+    fields = parse_fields_arg(PURCHASE_ORDER.names + list(PURCHASE_ORDER_EXPANSION_FIELDS.values()))
+    projection = PURCHASE_ORDER.only(fields, PurchaseOrder.OrderDate, PurchaseOrder.PurchaseOrderID)
+    if fields is not None:
+        include = {name for name in include if PURCHASE_ORDER_EXPANSION_FIELDS[name] in fields}
     
-    query = PurchaseOrder.query
+    query = PurchaseOrder.query.options(load_only(*projection.columns), *purchase_order_load_options(include))
     
     if status:
         query = query.filter(PurchaseOrder.Status == status)
     
-    orders = query.order_by(PurchaseOrder.OrderDate.desc()).all()
-    
-    return jsonify([{
-        'id': po.PurchaseOrderID,
-        'order_date': po.OrderDate.isoformat() if po.OrderDate else None,
-        'total_amount': float(po.TotalAmount) if po.TotalAmount else 0,
-        'status': po.Status,
-        'supplier_id': po.SupplierID,
-        'supplier_name': po.supplier.Name if po.supplier else None,
-        'demand_plan_id': po.DemandPlanID,
-        'items': [{
-            'inventory_id': poi.InventoryID,
-            'item_name': poi.inventory.ItemName if poi.inventory else None,
-            'quantity': poi.Quantity
-        } for poi in po.inventory_items]
-    } for po in orders])
+    page = keyset_page(query, PurchaseOrder.OrderDate, PurchaseOrder.PurchaseOrderID)
+    if not page:
+        return stream_response(query.order_by(PurchaseOrder.OrderDate.desc()),
+                               lambda po: serialize_purchase_order(po, include, projection))
+    
+    data = [serialize_purchase_order(po, include, projection) for po in page.items]
+    
+    return success_response(data, "Purchase orders retrieved successfully", page=page)
 
 @inventory_bp.route('/purchase-orders', methods=['POST'])
+@handle_exceptions
 def create_purchase_order():
     """Create a new purchase order"""
     data = request.json
@@ -237,6 +265,7 @@ def create_purchase_order():
         )
         db.session.add(financial_record)
         db.session.flush()
+        track_financial_record(financial_record)
         
         pofr = PurchaseOrderFinancialRecord(
             PurchaseOrderID=order.PurchaseOrderID,
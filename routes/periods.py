@@ -0,0 +1,159 @@
+from datetime import date, timedelta
+from sqlalchemy import event, func, insert, inspect
+from models import db, FinancialRecord, FinancialPeriod, FinancialPeriodSnapshot, FinancialPeriodAccountSnapshot
+from database import RoutingSession
+from .aggregates import time_bucket, next_month
+from .cache import bump_table_versions
+from .utils import ConflictError, utc_today
+import re
+
+PERIOD_FORMATS = (
+    (re.compile(r'^(\d{4})-(\d{2})$'), 'month'),
+    (re.compile(r'^(\d{4})-Q([1-4])$'), 'quarter'),
+    (re.compile(r'^(\d{4})$'), 'year'),
+)
+
+def parse_period(label):
+    """(label, first day, last day) of a period written 2024-03, 2024-Q1 or 2024"""
+    label = (label or '').strip().upper()
+    for pattern, kind in PERIOD_FORMATS:
+        match = pattern.match(label)
+        if not match:
+            continue
+        year = int(match.group(1))
+        if kind == 'month':
+            month, months = int(match.group(2)), 1
+            if not 1 <= month <= 12:
+                break
+        elif kind == 'quarter':
+            month, months = (int(match.group(2)) - 1) * 3 + 1, 3
+        else:
+            month, months = 1, 12
+        first = date(year, month, 1)
+        last = first
+        for _ in range(months):
+            last = next_month(last)
+        return label, first, last - timedelta(days=1)
+    raise ValueError(f"Invalid period '{label}'. Use YYYY-MM, YYYY-Qn or YYYY")
+
+def period_dict(period):
+    return {
+        'period': period.Period,
+        'start_date': period.PeriodStart.isoformat(),
+        'end_date': period.PeriodEnd.isoformat(),
+        'closed_at': period.ClosedAt.isoformat() if period.ClosedAt else None
+    }
+
+def closed_periods_between(first, last, session=None):
+    """Closed periods overlapping first..last, oldest first"""
+    return (session or db.session).query(FinancialPeriod).filter(
+        FinancialPeriod.PeriodEnd >= first, FinancialPeriod.PeriodStart <= last
+    ).order_by(FinancialPeriod.PeriodStart).all()
+
+def period_containing(periods, day):
+    return next((p for p in periods if p.PeriodStart <= day <= p.PeriodEnd), None)
+
+def close_period(label):
+    """Freeze the ledger totals of a month, quarter or year that has ended.
+
+    Totals are stored per month and TransactionType, and per month,
+    TransactionType and AccountCode, so closing a quarter or year still
+    serves monthly reports. Periods
+    already closed inside it are absorbed and keep their snapshots;
+    closing a period inside a closed one is refused.
+    """
+    label, first, last = parse_period(label)
+    if last >= utc_today():
+        raise ValueError(f"Period {label} has not ended yet")
+
+    enclosing = FinancialPeriod.query.filter(
+        FinancialPeriod.PeriodStart <= first, FinancialPeriod.PeriodEnd >= last
+    ).first()
+    if enclosing:
+        raise ConflictError(f"Period {label} is already closed" +
+                            (f" as part of {enclosing.Period}" if enclosing.Period != label else ""))
+    absorbed = FinancialPeriod.query.filter(
+        FinancialPeriod.PeriodStart >= first, FinancialPeriod.PeriodEnd <= last
+    ).all()
+
+    ledger = FinancialRecord
+    month = time_bucket(ledger.TransactionDate, 'month')
+    for model, keys in ((FinancialPeriodSnapshot, [ledger.TransactionType]),
+                        (FinancialPeriodAccountSnapshot, [ledger.TransactionType, ledger.AccountCode])):
+        totals = db.session.query(
+            month, *keys, func.count(ledger.FinancialRecordID), func.coalesce(func.sum(ledger.Amount), 0)
+        ).filter(
+            ledger.TransactionDate >= first, ledger.TransactionDate <= last
+        )
+        for period in absorbed:
+            totals = totals.filter(~ledger.TransactionDate.between(period.PeriodStart, period.PeriodEnd))
+        db.session.execute(insert(model).from_select(
+            ['MonthStart'] + [key.key for key in keys] + ['RecordCount', 'TotalAmount'],
+            totals.group_by(month, *keys)
+        ))
+
+    for period in absorbed:
+        db.session.delete(period)
+    # The closed period may start on the same day as one it absorbs
+    db.session.flush()
+    period = FinancialPeriod(PeriodStart=first, PeriodEnd=last, Period=label)
+    db.session.add(period)
+    bump_table_versions([FinancialPeriodSnapshot.__tablename__, FinancialPeriodAccountSnapshot.__tablename__])
+    db.session.commit()
+
+    return period
+
+def reopen_period(period):
+    """Drop a closed period and its snapshots, making its ledger rows editable again"""
+    for model in (FinancialPeriodSnapshot, FinancialPeriodAccountSnapshot):
+        model.query.filter(
+            model.MonthStart.between(period.PeriodStart, period.PeriodEnd)
+        ).delete(synchronize_session=False)
+    db.session.delete(period)
+    bump_table_versions([FinancialPeriodSnapshot.__tablename__, FinancialPeriodAccountSnapshot.__tablename__])
+    db.session.commit()
+
+def refuse_closed_period_writes(session, flush_context, instances):
+    """before_flush hook: refuse to add, change or delete ledger rows dated
+    in a closed period, whether the old or the new date"""
+    days = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, FinancialRecord):
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        days.add(obj.TransactionDate)
+        days.update(inspect(obj).attrs.TransactionDate.history.deleted)
+    days.discard(None)
+    if not days:
+        return
+
+    periods = closed_periods_between(min(days), max(days), session)
+    for day in sorted(days):
+        period = period_containing(periods, day)
+        if period:
+            raise ConflictError(f"Period {period.Period} is closed; reopen it to change its ledger entries")
+
+def install_closed_period_guard():
+    """Check every flush for ledger writes into closed periods. Bulk inserts
+    bypass the flush and use reject_closed_periods instead."""
+    if not event.contains(RoutingSession, 'before_flush', refuse_closed_period_writes):
+        event.listen(RoutingSession, 'before_flush', refuse_closed_period_writes)
+
+def reject_closed_periods(chunk, key, creates_ledger_row=None):
+    """Split (row_number, mapping) pairs on whether mapping[key] falls in a
+    closed period; `creates_ledger_row` limits the check to some mappings"""
+    days = [mapping[key] for _, mapping in chunk
+            if mapping.get(key) and (creates_ledger_row is None or creates_ledger_row(mapping))]
+    periods = closed_periods_between(min(days), max(days)) if days else []
+
+    kept, rejected = [], []
+    for number, mapping in chunk:
+        period = None
+        if periods and mapping.get(key) and (creates_ledger_row is None or creates_ledger_row(mapping)):
+            period = period_containing(periods, mapping[key])
+        if period:
+            rejected.append({'row': number, 'error': f"Period {period.Period} is closed"})
+        else:
+            kept.append((number, mapping))
+    return kept, rejected
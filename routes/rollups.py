@@ -0,0 +1,176 @@
+from sqlalchemy import func, insert, case, literal
+from sqlalchemy.exc import IntegrityError
+from decimal import Decimal
+from models import db, FinancialRecord, Donation, FinancialDailyRollup, DonationDailyRollup, AccountDailyBalance, AccountPeriodChange, AccountBalance
+from .aggregates import INCOME_TYPES, UNASSIGNED_ACCOUNT, BALANCE_PERIODS, time_bucket
+from .cache import bump_table_versions
+
+def _bump(model, type_column, day, row_type, count, amount):
+    """Add count/amount to the (day, type) rollup row, creating it if missing"""
+    query = model.query.filter(model.RollupDate == day, type_column == row_type)
+    values = {
+        model.RecordCount: model.RecordCount + count,
+        model.TotalAmount: model.TotalAmount + amount
+    }
+    if query.update(values, synchronize_session=False):
+        return
+
+    try:
+        with db.session.begin_nested():
+            row = model(RollupDate=day, RecordCount=count, TotalAmount=amount)
+            setattr(row, type_column.key, row_type)
+            db.session.add(row)
+    except IntegrityError:
+        # Another worker created the row between our UPDATE and INSERT
+        query.update(values, synchronize_session=False)
+
+def signed_amount(transaction_type, amount):
+    """A ledger amount as it moves its account's balance"""
+    return amount if transaction_type in INCOME_TYPES else -amount
+
+def _bump_counted(model, amount_column, key, count, amount):
+    """Add count/amount to the `model` row with primary key `key`, creating
+    it if missing and dropping it once its last entry is removed"""
+    query = model.query.filter_by(**key)
+    values = {model.RecordCount: model.RecordCount + count, amount_column: amount_column + amount}
+    if not query.update(values, synchronize_session=False):
+        try:
+            with db.session.begin_nested():
+                db.session.add(model(RecordCount=count, **{amount_column.key: amount}, **key))
+        except IntegrityError:
+            # Another worker created the row between our UPDATE and INSERT
+            query.update(values, synchronize_session=False)
+
+    if count < 0:
+        query.filter(model.RecordCount <= 0).delete(synchronize_session=False)
+
+def _bump_balance(account_code, day, count, amount):
+    """Add entries to an account's balance and to its rows for `day` and
+    for the month and year of `day`.
+
+    Only changes are stored below the balance, so a backdated entry writes
+    (and locks) these four rows, not every later day or month.
+    """
+    account = account_code or UNASSIGNED_ACCOUNT
+    _bump_counted(AccountDailyBalance, AccountDailyBalance.DayAmount,
+                  {'AccountCode': account, 'BalanceDate': day}, count, amount)
+    for period, start in BALANCE_PERIODS:
+        _bump_counted(AccountPeriodChange, AccountPeriodChange.Amount,
+                      {'AccountCode': account, 'Period': period, 'PeriodStart': start(day)}, count, amount)
+    _bump_counted(AccountBalance, AccountBalance.Balance, {'AccountCode': account}, count, amount)
+
+def track_financial_record(record, sign=1):
+    """Apply a FinancialRecord to the daily rollup and its account's
+    balance; sign=-1 removes it again"""
+    if not record.TransactionDate:
+        return
+    amount = Decimal(str(record.Amount)) if record.Amount else Decimal('0')
+    _bump(FinancialDailyRollup, FinancialDailyRollup.TransactionType,
+          record.TransactionDate, record.TransactionType, sign, sign * amount)
+    _bump_balance(record.AccountCode, record.TransactionDate, sign,
+                  sign * signed_amount(record.TransactionType, amount))
+
+def track_donation(donation, sign=1):
+    """Apply a Donation to the daily rollup; sign=-1 removes it again"""
+    if not donation.DonationDate:
+        return
+    amount = Decimal(str(donation.Amount)) if donation.Amount else Decimal('0')
+    _bump(DonationDailyRollup, DonationDailyRollup.DonationType,
+          donation.DonationDate, donation.DonationType, sign, sign * amount)
+
+def rebuild_rollups():
+    """Recompute both rollup tables and the account balances from the raw
+    ledger and donation tables"""
+    FinancialDailyRollup.query.delete()
+    DonationDailyRollup.query.delete()
+    AccountDailyBalance.query.delete()
+    AccountPeriodChange.query.delete()
+    AccountBalance.query.delete()
+
+    db.session.execute(insert(FinancialDailyRollup).from_select(
+        ['RollupDate', 'TransactionType', 'RecordCount', 'TotalAmount'],
+        db.session.query(
+            FinancialRecord.TransactionDate,
+            FinancialRecord.TransactionType,
+            func.count(FinancialRecord.FinancialRecordID),
+            func.coalesce(func.sum(FinancialRecord.Amount), 0)
+        ).filter(
+            FinancialRecord.TransactionDate.isnot(None)
+        ).group_by(FinancialRecord.TransactionDate, FinancialRecord.TransactionType)
+    ))
+    db.session.execute(insert(DonationDailyRollup).from_select(
+        ['RollupDate', 'DonationType', 'RecordCount', 'TotalAmount'],
+        db.session.query(
+            Donation.DonationDate,
+            Donation.DonationType,
+            func.count(Donation.DonationID),
+            func.coalesce(func.sum(Donation.Amount), 0)
+        ).filter(
+            Donation.DonationDate.isnot(None)
+        ).group_by(Donation.DonationDate, Donation.DonationType)
+    ))
+
+    ledger = FinancialRecord
+    account = func.coalesce(ledger.AccountCode, UNASSIGNED_ACCOUNT)
+    db.session.execute(insert(AccountDailyBalance).from_select(
+        ['AccountCode', 'BalanceDate', 'RecordCount', 'DayAmount'],
+        db.session.query(
+            account,
+            ledger.TransactionDate,
+            func.count(ledger.FinancialRecordID),
+            func.sum(case((ledger.TransactionType.in_(INCOME_TYPES), ledger.Amount), else_=-ledger.Amount))
+        ).filter(
+            ledger.TransactionDate.isnot(None)
+        ).group_by(account, ledger.TransactionDate)
+    ))
+    day = AccountDailyBalance
+    for period, _ in BALANCE_PERIODS:
+        start = time_bucket(day.BalanceDate, period)
+        db.session.execute(insert(AccountPeriodChange).from_select(
+            ['AccountCode', 'Period', 'PeriodStart', 'RecordCount', 'Amount'],
+            db.session.query(
+                day.AccountCode, literal(period), start, func.sum(day.RecordCount), func.sum(day.DayAmount)
+            ).group_by(day.AccountCode, start)
+        ))
+    db.session.execute(insert(AccountBalance).from_select(
+        ['AccountCode', 'RecordCount', 'Balance'],
+        db.session.query(day.AccountCode, func.sum(day.RecordCount), func.sum(day.DayAmount)).group_by(day.AccountCode)
+    ))
+    bump_table_versions([FinancialDailyRollup.__tablename__, DonationDailyRollup.__tablename__,
+                         AccountDailyBalance.__tablename__, AccountPeriodChange.__tablename__,
+                         AccountBalance.__tablename__])
+    db.session.commit()
+
+    return FinancialDailyRollup.query.count(), DonationDailyRollup.query.count(), AccountDailyBalance.query.count()
+
+def _bump_totals(model, type_column, rows, date_key, type_key):
+    totals = {}
+    for row in rows:
+        if not row.get(date_key):
+            continue
+        key = (row[date_key], row[type_key])
+        count, amount = totals.get(key, (0, Decimal('0')))
+        totals[key] = (count + 1, amount + Decimal(str(row.get('Amount') or 0)))
+    for (day, row_type), (count, amount) in totals.items():
+        _bump(model, type_column, day, row_type, count, amount)
+
+def track_financial_rows(rows):
+    """Apply bulk-inserted FinancialRecord mappings with one update per
+    (day, type) and one balance update per (account, day)"""
+    _bump_totals(FinancialDailyRollup, FinancialDailyRollup.TransactionType, rows,
+                 'TransactionDate', 'TransactionType')
+
+    balances = {}
+    for row in rows:
+        if not row.get('TransactionDate'):
+            continue
+        key = (row.get('AccountCode') or UNASSIGNED_ACCOUNT, row['TransactionDate'])
+        count, amount = balances.get(key, (0, Decimal('0')))
+        balances[key] = (count + 1, amount + signed_amount(row['TransactionType'], Decimal(str(row.get('Amount') or 0))))
+    for (account_code, day), (count, amount) in balances.items():
+        _bump_balance(account_code, day, count, amount)
+
+def track_donation_rows(rows):
+    """Apply bulk-inserted Donation mappings with one update per (day, type)"""
+    _bump_totals(DonationDailyRollup, DonationDailyRollup.DonationType, rows,
+                 'DonationDate', 'DonationType')
@@ -0,0 +1,221 @@
+from sqlalchemy import select, type_coerce, BigInteger
+from sqlalchemy.orm.attributes import QueryableAttribute
+from sqlalchemy.sql.elements import Label
+from models import (
+    db, FinancialRecord, Expense, Donation, Donor, Gift, Inventory, DemandPlan, Supplier,
+    PurchaseOrder, Staff, Attendance, Schedule, PerformanceReview, PayrollRecord
+)
+from .aggregates import donor_totals
+
+def iso(value):
+    return value.isoformat() if value else None
+
+def text(value):
+    return str(value) if value else None
+
+def number(value):
+    """Numeric column as a JSON number; NULL and zero both become 0"""
+    return float(value) if value else 0
+
+def cents(value):
+    """Integer cents (see raw_cents) as a JSON number; NULL and zero both become 0"""
+    return value / 100 if value else 0
+
+def raw_cents(column):
+    """Select a Money column as its stored integer cents, skipping the
+    Decimal built for every row; pair with the `cents` converter"""
+    return type_coerce(column, BigInteger)
+
+class Projection:
+    """Output fields of a list endpoint and the columns that produce them.
+
+    `fields` is a sequence of (name, column, convert) where `convert` maps
+    the raw column value to its JSON value (None keeps it as is). Queries
+    select plain tuples of exactly these columns, so no ORM objects are
+    built; values from related tables come in as correlated scalar
+    subqueries. Base-table columns keep their key, so keyset_page can read
+    its sort columns off the rows. `extra` columns are selected after the
+    fields but not serialized.
+    """
+
+    def __init__(self, model, fields, extra=()):
+        self.model = model
+        self.fields = [
+            (name, column if isinstance(column, (QueryableAttribute, Label)) else column.label(name), convert)
+            for name, column, convert in fields
+        ]
+        self.extra = list(extra)
+
+    @property
+    def names(self):
+        return [name for name, _, _ in self.fields]
+
+    def only(self, names, *keep):
+        """This projection restricted to the fields in `names` (all when None).
+
+        Columns in `keep`, usually the keyset sort columns, are still
+        selected when their field was not requested, so pagination works
+        with any field list.
+        """
+        fields = self.fields if names is None else [f for f in self.fields if f[0] in names]
+        selected = [column for _, column, _ in fields]
+        return Projection(self.model, fields, [
+            column for column in keep if not any(column is c for c in selected)
+        ])
+
+    @property
+    def columns(self):
+        return [column for _, column, _ in self.fields] + self.extra
+
+    def query(self):
+        return db.session.query(*self.columns).select_from(self.model)
+
+    def serialize(self, row):
+        return {
+            name: convert(value) if convert else value
+            for (name, _, convert), value in zip(self.fields, row)
+        }
+
+    def serialize_all(self, rows):
+        return [self.serialize(row) for row in rows]
+
+    def serialize_object(self, obj):
+        """Serialize an ORM instance loaded with load_only(*self.columns)"""
+        return {
+            name: convert(getattr(obj, column.key)) if convert else getattr(obj, column.key)
+            for name, column, convert in self.fields
+        }
+
+def related(column, foreign_key, primary_key):
+    """Correlated scalar subquery reading `column` of the row `foreign_key` points at"""
+    return select(column).where(primary_key == foreign_key).scalar_subquery()
+
+FINANCIAL_RECORD = Projection(FinancialRecord, [
+    ('id', FinancialRecord.FinancialRecordID, None),
+    ('date', FinancialRecord.TransactionDate, iso),
+    ('type', FinancialRecord.TransactionType, None),
+    ('amount', raw_cents(FinancialRecord.Amount), cents),
+    ('account_code', FinancialRecord.AccountCode, None),
+    ('description', FinancialRecord.Description, None),
+])
+
+EXPENSE = Projection(Expense, [
+    ('id', Expense.ExpenseID, None),
+    ('date', Expense.Date, iso),
+    ('type', Expense.Type, None),
+    ('amount', raw_cents(Expense.Amount), cents),
+    ('description', Expense.Description, None),
+    ('staff_id', Expense.StaffID, None),
+])
+
+DONATION = Projection(Donation, [
+    ('id', Donation.DonationID, None),
+    ('type', Donation.DonationType, None),
+    ('status', Donation.Status, None),
+    ('amount', raw_cents(Donation.Amount), cents),
+    ('date', Donation.DonationDate, iso),
+    ('donor_id', Donation.DonorID, None),
+    ('donor_name', related(Donor.Name, Donation.DonorID, Donor.DonorID), None),
+    ('staff_id', Donation.StaffID, None),
+    ('gift_id', Donation.GiftID, None),
+])
+
+# The listed donor's row of donor_totals(), correlated per donor
+DONOR_TOTALS = donor_totals(Donor.DonorID)
+
+DONOR = Projection(Donor, [
+    ('id', Donor.DonorID, None),
+    ('name', Donor.Name, None),
+    ('contact_info', Donor.ContactInfo, None),
+    ('registration_date', Donor.RegistrationDate, iso),
+    ('age', Donor.Age, None),
+    ('region', Donor.Region, None),
+    ('total_donations', raw_cents(
+        DONOR_TOTALS.with_only_columns(DONOR_TOTALS.selected_columns.total_amount).scalar_subquery()
+    ), cents),
+])
+
+GIFT = Projection(Gift, [
+    ('id', Gift.GiftID, None),
+    ('type', Gift.GiftType, None),
+    ('quantity', Gift.Quantity, None),
+    ('distribution_date', Gift.DistributionDate, iso),
+])
+
+INVENTORY = Projection(Inventory, [
+    ('id', Inventory.InventoryID, None),
+    ('item_name', Inventory.ItemName, None),
+    ('quantity', Inventory.Quantity, None),
+    ('location', Inventory.Location, None),
+    ('demand_plan_id', Inventory.DemandPlanID, None),
+])
+
+DEMAND_PLAN = Projection(DemandPlan, [
+    ('id', DemandPlan.DemandPlanID, None),
+    ('item_name', DemandPlan.ItemName, None),
+    ('forecast_quantity', DemandPlan.ForecastQuantity, None),
+    ('plan_date', DemandPlan.PlanDate, iso),
+])
+
+SUPPLIER = Projection(Supplier, [
+    ('id', Supplier.SupplierID, None),
+    ('name', Supplier.Name, None),
+    ('contact_info', Supplier.ContactInfo, None),
+    ('address', Supplier.Address, None),
+])
+
+PURCHASE_ORDER = Projection(PurchaseOrder, [
+    ('id', PurchaseOrder.PurchaseOrderID, None),
+    ('order_date', PurchaseOrder.OrderDate, iso),
+    ('total_amount', PurchaseOrder.TotalAmount, number),
+    ('status', PurchaseOrder.Status, None),
+    ('supplier_id', PurchaseOrder.SupplierID, None),
+    ('demand_plan_id', PurchaseOrder.DemandPlanID, None),
+])
+
+STAFF = Projection(Staff, [
+    ('id', Staff.StaffID, None),
+    ('name', Staff.Name, None),
+    ('role', Staff.Role, None),
+    ('contact_info', Staff.ContactInfo, None),
+    ('status', Staff.Status, None),
+])
+
+ATTENDANCE = Projection(Attendance, [
+    ('id', Attendance.AttendanceID, None),
+    ('date', Attendance.Date, iso),
+    ('check_in', Attendance.CheckIn, text),
+    ('check_out', Attendance.CheckOut, text),
+    ('status', Attendance.Status, None),
+    ('staff_id', Attendance.StaffID, None),
+    ('staff_name', related(Staff.Name, Attendance.StaffID, Staff.StaffID), None),
+])
+
+SCHEDULE = Projection(Schedule, [
+    ('id', Schedule.ScheduleID, None),
+    ('shift_date', Schedule.ShiftDate, iso),
+    ('shift_type', Schedule.ShiftType, None),
+    ('field', Schedule.Field, None),
+    ('hours', Schedule.Hours, number),
+    ('location', Schedule.Location, None),
+    ('staff_id', Schedule.StaffID, None),
+    ('staff_name', related(Staff.Name, Schedule.StaffID, Staff.StaffID), None),
+])
+
+PERFORMANCE_REVIEW = Projection(PerformanceReview, [
+    ('id', PerformanceReview.PerformanceReviewID, None),
+    ('review_date', PerformanceReview.ReviewDate, iso),
+    ('score', PerformanceReview.Score, number),
+    ('comments', PerformanceReview.Comments, None),
+    ('staff_id', PerformanceReview.StaffID, None),
+    ('staff_name', related(Staff.Name, PerformanceReview.StaffID, Staff.StaffID), None),
+])
+
+PAYROLL_RECORD = Projection(PayrollRecord, [
+    ('id', PayrollRecord.PayrollRecordID, None),
+    ('pay_period', PayrollRecord.PayPeriod, None),
+    ('amount', raw_cents(PayrollRecord.Amount), cents),
+    ('payment_date', PayrollRecord.PaymentDate, iso),
+    ('staff_id', PayrollRecord.StaffID, None),
+    ('staff_name', related(Staff.Name, PayrollRecord.StaffID, Staff.StaffID), None),
+])
@@ -2,17 +2,23 @@ from flask import Blueprint, request, jsonify
 from models import db, Staff, Attendance, Schedule, PerformanceReview, PayrollRecord
 from datetime import datetime
 from decimal import Decimal
-from .utils import success_response, error_response, handle_exceptions, validate_json
+from .utils import success_response, error_response, handle_exceptions, validate_json, keyset_page, stream_response, json_response, parse_fields_arg
+from .rollups import track_financial_record
+from .cache import conditional_get
+from .serializers import STAFF, ATTENDANCE, SCHEDULE, PERFORMANCE_REVIEW, PAYROLL_RECORD
 
 staff_bp = Blueprint('staff', __name__)
+conditional_get(staff_bp, 'staff', 'attendance', 'schedule', 'performance_review', 'payroll_record')
 
 @staff_bp.route('/staff', methods=['GET'])
+@handle_exceptions
 def get_staff():
     """Get all staff members"""
     status = request.args.get('status')
     role = request.args.get('role')
     
-    query = Staff.query
+    projection = STAFF.only(parse_fields_arg(STAFF.names))
+    query = projection.query()
     
     if status:
         query = query.filter(Staff.Status == status)
@@ -21,13 +27,7 @@ def get_staff():
     
     staff_list = query.all()
     
-    return jsonify([{
-        'id': s.StaffID,
-        'name': s.Name,
-        'role': s.Role,
-        'contact_info': s.ContactInfo,
-        'status': s.Status
-    } for s in staff_list])
+    return json_response(projection.serialize_all(staff_list))
 
 @staff_bp.route('/staff', methods=['POST'])
 @validate_json
@@ -94,13 +94,15 @@ def update_staff(staff_id):
     }, "Staff member updated successfully")
 
 @staff_bp.route('/attendance', methods=['GET'])
+@handle_exceptions
 def get_attendance():
     """Get attendance records"""
     staff_id = request.args.get('staff_id')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    query = Attendance.query
+    projection = ATTENDANCE.only(parse_fields_arg(ATTENDANCE.names), Attendance.Date, Attendance.AttendanceID)
+    query = projection.query()
     
     if staff_id:
         query = query.filter(Attendance.StaffID == int(staff_id))
@@ -109,17 +111,13 @@ def get_attendance():
     if end_date:
         query = query.filter(Attendance.Date <= datetime.strptime(end_date, '%Y-%m-%d').date())
     
-    records = query.order_by(Attendance.Date.desc()).all()
-    
-    return jsonify([{
-        'id': a.AttendanceID,
-        'date': a.Date.isoformat() if a.Date else None,
-        'check_in': str(a.CheckIn) if a.CheckIn else None,
-        'check_out': str(a.CheckOut) if a.CheckOut else None,
-        'status': a.Status,
-        'staff_id': a.StaffID,
-        'staff_name': a.staff.Name if a.staff else None
-    } for a in records])
+    page = keyset_page(query, Attendance.Date, Attendance.AttendanceID)
+    if not page:
+        return stream_response(query.order_by(Attendance.Date.desc()), projection.serialize)
+    
+    data = projection.serialize_all(page.items)
+    
+    return success_response(data, "Attendance records retrieved successfully", page=page)
 
 @staff_bp.route('/attendance', methods=['POST'])
 @validate_json
@@ -149,27 +147,25 @@ def create_attendance():
         return error_response(f"Invalid date/time format: {str(e)}", 400)
 
 @staff_bp.route('/schedules', methods=['GET'])
+@handle_exceptions
 def get_schedules():
     """Get staff schedules"""
     staff_id = request.args.get('staff_id')
     
-    query = Schedule.query
+    projection = SCHEDULE.only(parse_fields_arg(SCHEDULE.names), Schedule.ShiftDate, Schedule.ScheduleID)
+    query = projection.query()
     
     if staff_id:
         query = query.filter(Schedule.StaffID == int(staff_id))
     
-    schedules = query.order_by(Schedule.ShiftDate.desc()).all()
-    
-    return jsonify([{
-        'id': s.ScheduleID,
-        'shift_date': s.ShiftDate.isoformat() if s.ShiftDate else None,
-        'shift_type': s.ShiftType,
-        'field': s.Field,
-        'hours': float(s.Hours) if s.Hours else 0,
-        'location': s.Location,
-        'staff_id': s.StaffID,
-        'staff_name': s.staff.Name if s.staff else None
-    } for s in schedules])
+    page = keyset_page(query, Schedule.ShiftDate, Schedule.ScheduleID)
+    schedules = page.items if page else query.order_by(Schedule.ShiftDate.desc()).all()
+    
+    data = projection.serialize_all(schedules)
+    
+    if page:
+        return success_response(data, "Schedules retrieved successfully", page=page)
+    return json_response(data)
 
 @staff_bp.route('/schedules', methods=['POST'])
 @validate_json
@@ -200,25 +196,20 @@ def create_schedule():
         return error_response(f"Invalid date format: {str(e)}", 400)
 
 @staff_bp.route('/performance-reviews', methods=['GET'])
+@handle_exceptions
 def get_performance_reviews():
     """Get performance reviews"""
     staff_id = request.args.get('staff_id')
     
-    query = PerformanceReview.query
+    projection = PERFORMANCE_REVIEW.only(parse_fields_arg(PERFORMANCE_REVIEW.names))
+    query = projection.query()
     
     if staff_id:
         query = query.filter(PerformanceReview.StaffID == int(staff_id))
     
     reviews = query.order_by(PerformanceReview.ReviewDate.desc()).all()
     
-    return jsonify([{
-        'id': pr.PerformanceReviewID,
-        'review_date': pr.ReviewDate.isoformat() if pr.ReviewDate else None,
-        'score': float(pr.Score) if pr.Score else 0,
-        'comments': pr.Comments,
-        'staff_id': pr.StaffID,
-        'staff_name': pr.staff.Name if pr.staff else None
-    } for pr in reviews])
+    return json_response(projection.serialize_all(reviews))
 
 @staff_bp.route('/performance-reviews', methods=['POST'])
 def create_performance_review():
@@ -238,27 +229,28 @@ def create_performance_review():
     return jsonify({'id': review.PerformanceReviewID, 'message': 'Performance review created successfully'}), 201
 
 @staff_bp.route('/payroll', methods=['GET'])
+@handle_exceptions
 def get_payroll():
     """Get payroll records"""
     staff_id = request.args.get('staff_id')
     
-    query = PayrollRecord.query
+    projection = PAYROLL_RECORD.only(parse_fields_arg(PAYROLL_RECORD.names), PayrollRecord.PaymentDate, PayrollRecord.PayrollRecordID)
+    query = projection.query()
     
     if staff_id:
         query = query.filter(PayrollRecord.StaffID == int(staff_id))
     
-    records = query.order_by(PayrollRecord.PaymentDate.desc()).all()
+    page = keyset_page(query, PayrollRecord.PaymentDate, PayrollRecord.PayrollRecordID)
+    records = page.items if page else query.order_by(PayrollRecord.PaymentDate.desc()).all()
     
-    return jsonify([{
-        'id': pr.PayrollRecordID,
-        'pay_period': pr.PayPeriod,
-        'amount': float(pr.Amount) if pr.Amount else 0,
-        'payment_date': pr.PaymentDate.isoformat() if pr.PaymentDate else None,
-        'staff_id': pr.StaffID,
-        'staff_name': pr.staff.Name if pr.staff else None
-    } for pr in records])
+    data = projection.serialize_all(records)
+    
+    if page:
+        return success_response(data, "Payroll records retrieved successfully", page=page)
+    return json_response(data)
 
 @staff_bp.route('/payroll', methods=['POST'])
+@handle_exceptions
 def create_payroll():
     """Create a new payroll record"""
     data = request.json
@@ -282,6 +274,7 @@ def create_payroll():
     )
     db.session.add(financial_record)
     db.session.flush()
+    track_financial_record(financial_record)
     
     pfr = PayrollFinancialRecord(
         PayrollRecordID=payroll.PayrollRecordID,
@@ -1,14 +1,55 @@
-from flask import jsonify, request
+from flask import jsonify, request, json as flask_json, Response, stream_with_context, current_app
 from functools import wraps
+from collections import namedtuple
+from datetime import date, datetime
+from sqlalchemy import and_, or_
+import base64
+import json
 
-def success_response(data=None, message="Success", status_code=200):
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows fetched from the cursor (and written to the socket) per chunk when streaming
+STREAM_BATCH_SIZE = 500
+
+Page = namedtuple('Page', ['items', 'next_cursor'])
+
+def _orjson_default(value):
+    return current_app.json_encoder().default(value)
+
+def dumps(data):
+    """Encode `data` as JSON text.
+
+    Uses orjson when it is installed and JSON_BACKEND is not 'stdlib',
+    otherwise Flask's encoder. Both sort keys like jsonify does; types
+    orjson would format differently or cannot encode (dates, Decimals)
+    are handed to Flask's encoder so the output is the same either way.
+    """
+    if orjson is not None and current_app.config.get('JSON_BACKEND') != 'stdlib':
+        return orjson.dumps(data, default=_orjson_default, option=(
+            orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        )).decode()
+    return flask_json.dumps(data)
+
+def json_response(data, status_code=200):
+    """Like jsonify, but encoded through dumps()"""
+    return Response(dumps(data), status=status_code, mimetype='application/json')
+
+def success_response(data=None, message="Success", status_code=200, page=None):
     """Standard success response format"""
     response = {
         'success': True,
         'message': message,
         'data': data
     }
-    return jsonify(response), status_code
+    if page is not None:
+        response['next_cursor'] = page.next_cursor
+    return json_response(response, status_code)
 
 def error_response(message="Error", status_code=400, errors=None):
     """Standard error response format"""
@@ -19,6 +60,20 @@ def error_response(message="Error", status_code=400, errors=None):
     }
     return jsonify(response), status_code
 
+def utc_today():
+    """Today's date in UTC, the day "today" means for date windows and defaults"""
+    return datetime.utcnow().date()
+
+def parse_date_arg(name):
+    """Parse an optional YYYY-MM-DD query argument; raises ValueError when malformed"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f"Invalid {name} format. Use YYYY-MM-DD")
+
 def validate_json(f):
     """Decorator to validate JSON request"""
     @wraps(f)
@@ -28,6 +83,9 @@ def validate_json(f):
         return f(*args, **kwargs)
     return decorated_function
 
+class ConflictError(Exception):
+    """A well-formed request the current state does not allow (HTTP 409)"""
+
 def handle_exceptions(f):
     """Decorator to handle exceptions"""
     @wraps(f)
@@ -36,7 +94,124 @@ def handle_exceptions(f):
             return f(*args, **kwargs)
         except ValueError as e:
             return error_response(str(e), 400)
+        except ConflictError as e:
+            return error_response(str(e), 409)
         except Exception as e:
             return error_response(f"Internal server error: {str(e)}", 500)
     return decorated_function
 
+
+def parse_include_arg(allowed):
+    """Expansions requested with ?include=a,b; all of `allowed` when absent"""
+    raw = request.args.get('include')
+    if raw is None:
+        return set(allowed)
+    requested = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown include '{', '.join(sorted(unknown))}'. Allowed: {', '.join(allowed)}")
+    return requested
+
+def parse_fields_arg(allowed):
+    """Fields requested with ?fields=a,b; None (every field) when absent"""
+    raw = request.args.get('fields')
+    if raw is None:
+        return None
+    requested = {name.strip() for name in raw.split(',') if name.strip()}
+    if not requested:
+        raise ValueError(f"fields must name at least one of: {', '.join(allowed)}")
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown field '{', '.join(sorted(unknown))}'. Allowed: {', '.join(allowed)}")
+    return requested
+
+def _encode_cursor(values):
+    payload = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def _decode_cursor(cursor, columns):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(payload, list) or len(payload) != len(columns):
+            raise ValueError
+        values = []
+        for column, value in zip(columns, payload):
+            python_type = column.type.python_type
+            if python_type in (date, datetime):
+                values.append(python_type.fromisoformat(value))
+            else:
+                values.append(python_type(value))
+        return values
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def _after_cursor(columns, values):
+    """WHERE clause for rows strictly after the cursor in descending order"""
+    clause = columns[-1] < values[-1]
+    for column, value in reversed(list(zip(columns[:-1], values[:-1]))):
+        clause = or_(column < value, and_(column == value, clause))
+    return clause
+
+def keyset_page(query, *columns, row_key=None):
+    """Opt-in keyset pagination driven by the `limit` and `cursor` query args.
+
+    `columns` are the descending sort columns, ending with a unique
+    tiebreaker (normally the primary key). Returns None when the caller
+    did not ask for a page, so the endpoint can keep its plain response;
+    otherwise a Page whose next_cursor is None on the last page.
+    `row_key` maps a result row to the model instance holding the columns.
+    """
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return None
+    
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    limit = min(limit, MAX_PAGE_SIZE)
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.filter(_after_cursor(columns, _decode_cursor(cursor, columns)))
+    
+    rows = query.order_by(*[c.desc() for c in columns]).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = row_key(rows[-1]) if row_key else rows[-1]
+        next_cursor = _encode_cursor([getattr(last, c.key) for c in columns])
+    
+    return Page(rows, next_cursor)
+
+def stream_response(query, serialize, message=None):
+    """Stream query results as a JSON array without materializing the list.
+
+    Rows are pulled from the cursor STREAM_BATCH_SIZE at a time via
+    yield_per and each batch is serialized and sent before the next one
+    is fetched, so memory stays bounded by the batch size. With a
+    `message` the array is wrapped in the standard success envelope.
+    """
+    if message is None:
+        head, tail = '[', ']'
+    else:
+        head = '{"success": true, "message": %s, "data": [' % dumps(message)
+        tail = ']}'
+    
+    def generate():
+        yield head
+        separator = ''
+        batch = []
+        for row in query.yield_per(STREAM_BATCH_SIZE):
+            batch.append(serialize(row))
+            if len(batch) == STREAM_BATCH_SIZE:
+                yield separator + dumps(batch)[1:-1]
+                separator = ','
+                batch = []
+        if batch:
+            yield separator + dumps(batch)[1:-1]
+        yield tail
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
@@ -92,14 +92,16 @@ function loadTabData(tab) {
 // Dashboard
 async function loadDashboard() {
     try {
-        const [overview, financialTrends, donationTrends, expenseBreakdown, demographics, topDonors] = await Promise.all([
-            fetchAPI(`${API_BASE}/dashboard/overview`),
-            fetchAPI(`${API_BASE}/dashboard/financial-trends?days=30`),
-            fetchAPI(`${API_BASE}/dashboard/donation-trends?days=30`),
-            fetchAPI(`${API_BASE}/dashboard/expense-breakdown`),
-            fetchAPI(`${API_BASE}/donation/demographics`),
-            fetchAPI(`${API_BASE}/dashboard/top-donors?limit=10`)
-        ]);
+        // All widgets in one request, computed concurrently on the server
+        const bundle = await fetchAPI(`${API_BASE}/dashboard/bundle?financial_trends.days=30&donation_trends.days=30&top_donors.limit=10`);
+        const {
+            overview,
+            financial_trends: financialTrends,
+            donation_trends: donationTrends,
+            expense_breakdown: expenseBreakdown,
+            demographics,
+            top_donors: topDonors
+        } = bundle;
 
         // Update stats
         document.getElementById('total-income').textContent = `$${overview.financial.total_income.toLocaleString()}`;
@@ -281,17 +283,49 @@ function renderTopDonorsChart(data) {
     });
 }
 
+// ETag and data of the last GET response per URL, so unchanged data comes back as a bodyless 304.
+// Least recently used first (Map keeps insertion order); only the newest ETAG_CACHE_SIZE URLs are kept
+const ETAG_CACHE_SIZE = 20;
+const etagCache = new Map();
+
+function rememberResponse(url, entry) {
+    etagCache.delete(url);
+    etagCache.set(url, entry);
+    if (etagCache.size > ETAG_CACHE_SIZE) {
+        etagCache.delete(etagCache.keys().next().value);
+    }
+}
+
 // Helper function to handle API responses
 async function fetchAPI(url, options = {}) {
     try {
+        const isGet = (options.method || 'GET').toUpperCase() === 'GET';
+        const cached = isGet ? etagCache.get(url) : null;
+        if (isGet) {
+            // Revalidate ourselves instead of letting the browser cache answer
+            options = { ...options, cache: 'no-store', headers: { ...options.headers } };
+            if (cached) {
+                options.headers['If-None-Match'] = cached.etag;
+            }
+        }
+
         const response = await fetch(url, options);
+        if (response.status === 304 && cached) {
+            rememberResponse(url, cached);
+            return cached.data;
+        }
         const result = await response.json();
 
         if (result.success === false) {
             throw new Error(result.message || 'Request failed');
         }
 
-        return result.data || result;
+        const data = result.data || result;
+        const etag = response.headers.get('ETag');
+        if (isGet && etag) {
+            rememberResponse(url, { etag, data });
+        }
+        return data;
     } catch (error) {
         console.error('API Error:', error);
         throw error;
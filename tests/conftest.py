@@ -0,0 +1,20 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """The application on an empty SQLite database of its own"""
+    directory = tmp_path_factory.mktemp('app')
+    # app.py reads these at import time
+    os.environ['DATABASE_URL'] = f"sqlite:///{directory / 'test.db'}"
+    os.environ['METRICS_DIR'] = str(directory / 'metrics')
+    from app import app
+    from models import db
+    with app.app_context():
+        db.create_all()
+    return app
@@ -0,0 +1,62 @@
+from datetime import date, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db, Supplier, Inventory, PurchaseOrder, PurchaseOrderInventory
+
+URLS = [
+    '/api/inventory/purchase-orders',
+    '/api/inventory/purchase-orders?include=items',
+    '/api/inventory/purchase-orders?include=supplier',
+    '/api/inventory/purchase-orders?include=items,supplier',
+]
+
+def add_purchase_orders(count):
+    """Add `count` orders spread over new suppliers, with one to three items each"""
+    suppliers = [Supplier(Name=f'Supplier {i}') for i in range(3)]
+    items = [Inventory(ItemName=f'Item {i}', Quantity=10) for i in range(3)]
+    db.session.add_all(suppliers + items)
+    db.session.flush()
+    for i in range(count):
+        order = PurchaseOrder(OrderDate=date(2024, 1, 1) + timedelta(days=i), TotalAmount=100,
+                              Status='Pending', SupplierID=suppliers[i % 3].SupplierID)
+        db.session.add(order)
+        db.session.flush()
+        db.session.add_all(PurchaseOrderInventory(PurchaseOrderID=order.PurchaseOrderID,
+                                                  InventoryID=item.InventoryID, Quantity=i + 1)
+                           for item in items[:1 + i % 3])
+    db.session.commit()
+
+def select_count(client, url):
+    """SELECTs issued by a GET of `url`, and its decoded body"""
+    selects = []
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            selects.append(statement)
+    
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+        response.get_data()  # streamed bodies query while they are read
+    finally:
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return len(selects), response.get_json()
+
+def test_purchase_order_selects_do_not_grow_with_orders(app):
+    client = app.test_client()
+    with app.app_context():
+        add_purchase_orders(3)
+    few = {url: select_count(client, url)[0] for url in URLS}
+    
+    with app.app_context():
+        add_purchase_orders(300)
+    many = {}
+    for url in URLS:
+        many[url], orders = select_count(client, url)
+        assert len(orders) == 303
+    
+    assert many == few
+    assert all('items' in order and 'supplier_name' in order for order in orders)